@@ -6,12 +6,15 @@ import pandas as pd
 import typer
 
 from neta import scrape
-from neta.connectors import get_connector_paths
+from neta.cache import adopt_file_state
+from neta.connectors import get_connector_paths, k_shortest_paths
 from neta.constants import EDGE_CSV_PATH, USERS_FILE_PATH
-from neta.graph import NetworkContainer
-from neta.helpers import UserHelper, top_n
-from neta.network_analysis import GWWC_NODES, connector_nodes, gwwc_alignment_fast
-from neta.recommendations import Recommendation
+from neta.distance_index import DistanceIndex
+from neta.graph import NetworkContainer, PruningConfig
+from neta.helpers import UserHelper
+from neta.loaders import load_edges, load_users
+from neta.network_analysis import GWWC_NODES, normalized_gwwc_alignment
+from neta.recommendations import PIXIE_EARLY_STOPPING, Recommendation
 
 app = typer.Typer()
 
@@ -26,6 +29,33 @@ def analyze_user(
     use_recommender: bool = typer.Option(
         False, "--use-recommender", help="Pass to use recommender method."
     ),
+    processes: int = typer.Option(
+        None,
+        help="Number of processes to run the recommender's random walks on "
+        "(walks run in a single process if omitted).",
+    ),
+    early_stopping: bool = typer.Option(
+        False,
+        "--early-stopping",
+        help="Stop the recommender's walks from a seed once its top candidates have "
+        "converged (Pixie's early-stopping criterion).",
+    ),
+    k_shortest: bool = typer.Option(
+        False,
+        "--k-shortest",
+        help="Rank connector paths of the same length by the GWWC alignment of the "
+        "connectors, and print paths as they are found.",
+    ),
+    max_degree: int = typer.Option(
+        None,
+        help="Prune the network so each account keeps at most this many neighbors "
+        "(those with the most followers).",
+    ),
+    max_hub_degree: int = typer.Option(
+        None,
+        help="Prune edges into accounts with more than this many incoming edges "
+        "(e.g. celebrities followed by a large part of the network).",
+    ),
     undirected: bool = typer.Option(
         False, "--undirected", help="Use an undirected graph. (not recommended)"
     ),
@@ -51,21 +81,24 @@ def analyze_user(
     handler.setFormatter(formatter)
     logging.getLogger().addHandler(handler)
 
-    users = pd.read_csv(USERS_FILE_PATH)
-    edges = pd.read_csv(EDGE_CSV_PATH)
+    # Only the source column is needed to tell whether the user was scraped already
+    source = "follower" if method == "following" else "followed"
+    users = load_users()
+    edges = load_edges([source])
     # This won't be updated with new users, which should be fine (new users shouldn't
     # show up in results!)
     user_helper = UserHelper(users)
     logging.info("Loaded users + edges, loading network.")
-    network_container = NetworkContainer.get_network(
-        directed=not undirected, edges=edges
+    pruning = None
+    if max_degree is not None or max_hub_degree is not None:
+        pruning = PruningConfig(max_hub_degree=max_hub_degree, max_degree=max_degree)
+    # Scraped edges go into the full network (and its delta log), which is then pruned
+    full_container = NetworkContainer.get_network(
+        directed=not undirected, version=method
     )
 
     user = lookup_user(lookup, id=True if lookup.isnumeric() else False)
     user["id"] = int(user["id"])
-    # Define source/target and add to csvs if not in graph already
-    source = "follower" if method == "following" else "followed"
-    target = "followed" if method == "following" else "follower"
 
     if user["id"] in edges[source].to_numpy():
         logging.info(f"User {user} already in dataset - starting analysis.")
@@ -83,20 +116,51 @@ def analyze_user(
         )
         # Get new follows and add them to the graph
         extra_edges = get_follows(user["id"], method, users, edges)
-        network_container.network.add_edges_from(
-            extra_edges[[source, target]].to_numpy()
+        full_container.add_edges(
+            extra_edges["follower"].to_numpy(), extra_edges["followed"].to_numpy()
         )
+        # The edge file now holds exactly the cached edges plus the delta log
+        adopt_file_state(EDGE_CSV_PATH, full_container.fingerprint)
+
+    network_container = full_container
+    if pruning is not None:
+        network_container = full_container.pruned(pruning)
 
     if use_recommender:
-        analyze_recommend(user["id"], network_container, n, user_helper, out_dir)
+        analyze_recommend(
+            user["id"],
+            network_container,
+            n,
+            user_helper,
+            out_dir,
+            processes,
+            PIXIE_EARLY_STOPPING if early_stopping else None,
+        )
     else:
-        analyze(user["id"], network_container, n, user_helper, out_dir)
+        analyze(user["id"], network_container, n, user_helper, out_dir, k_shortest)
 
-    network_container.cache()
+    full_container.maybe_compact()
 
 
-def analyze(id, network_container, n, user_helper, out_dir):
-    conn_paths = get_connector_paths(network_container.network_edge_list, GWWC_NODES, id, n)
+def analyze(id, network_container, n, user_helper, out_dir, k_shortest=False):
+    distance_index = DistanceIndex.for_network(network_container, GWWC_NODES)
+    if k_shortest:
+        conn_paths = k_shortest_paths(
+            network_container.network_edge_list,
+            GWWC_NODES,
+            id,
+            n,
+            node_weights=normalized_gwwc_alignment(network_container),
+            distance_index=distance_index,
+        )
+    else:
+        conn_paths = get_connector_paths(
+            network_container.network_edge_list,
+            GWWC_NODES,
+            id,
+            n,
+            distance_index=distance_index,
+        )
     # user_helper.users_with_values(conn_nodes).to_csv(
     #     out_dir / f"{user_helper.get_username(id)}.csv"
     # )
@@ -105,10 +169,15 @@ def analyze(id, network_container, n, user_helper, out_dir):
         print(f"{' IS FOLLOWED BY '.join(usernames)}")
 
 
-def analyze_recommend(id, network_container, n, user_helper, out_dir):
+def analyze_recommend(
+    id, network_container, n, user_helper, out_dir, processes=None, early_stopping=None
+):
     recommendation_engine = Recommendation(network_container)
-    most_aligned = recommendation_engine.recommendations(GWWC_NODES, n)
-    most_aligned = top_n(gwwc_alignment_fast(), n)
+    most_aligned = recommendation_engine.recommendations(
+        GWWC_NODES, n, num_processes=processes, early_stopping=early_stopping
+    )
+    for seed_id, stats in recommendation_engine.convergence_stats.items():
+        logging.info(f"Walks from {seed_id}: {stats}")
     user_helper.users_with_values(most_aligned).to_csv(
         out_dir / f"{user_helper.get_username(id)}.csv"
     )
@@ -117,7 +186,7 @@ def analyze_recommend(id, network_container, n, user_helper, out_dir):
 
 def get_follows(user_id, method, users, edges, filter_metric_above=5000):
     url = scrape.url_follows(user_id, method)
-    response = scrape.connect_to_endpoint(url, wait=False)
+    response = scrape.connect_to_endpoint(url)
     has_data = response != -1
     # Series of connections to sort by their metric (the top of which will be chosen to
     # explore further)
@@ -191,9 +260,7 @@ def lookup_user(user: str, id=False):
     :param id: boolean indicating whether lookup happens through handle or ID
     """
     url = scrape.url_user_lookup([user], by="id" if id else "handle")
-    response = scrape.connect_to_endpoint(
-        url, max_results=None, tpr=15 / 300
-    )  # 300rp15m
+    response = scrape.connect_to_endpoint(url, endpoint="lookup", max_results=None)
     return response["data"][0]
 
 
@@ -0,0 +1,179 @@
+"""
+Batch bridge analysis: the top connector accounts (see connector_nodes) between the
+GWWC accounts and each of a list of target accounts, written as one report per target
+(results/bridge/{handle}-bridge.txt) plus a summary of the accounts that bridge to the
+most targets.
+"""
+
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+
+from neta.graph import NetworkContainer, NetworkEdgeList
+from neta.helpers import ScoreVector, UserHelper, top_n
+from neta.network_analysis import connector_nodes_batch, normalized_gwwc_alignment
+from neta.parallel import SharedArrays, attach_arrays
+
+# Targets per task. The alignments of a task's targets are computed together as one
+# sparse product, and only their top scores are sent back.
+BRIDGE_CHUNK_SIZE = 16
+
+
+def bridge_scores(
+    network_container: NetworkContainer, target_ids: List[int], n, num_processes=None
+) -> Dict[int, Dict[int, float]]:
+    """
+    Returns the top n connector_nodes of each target ID. Targets are processed in chunks
+    of BRIDGE_CHUNK_SIZE, in a pool of num_processes worker processes if given. The
+    workers share one read-only copy of the graph arrays and the GWWC alignments (see
+    SharedArrays), which are only computed once.
+    """
+    graph = network_container.network_edge_list
+    gwwc_alignments = normalized_gwwc_alignment(network_container)
+    tasks = [
+        (target_ids[start : start + BRIDGE_CHUNK_SIZE], n)
+        for start in range(0, len(target_ids), BRIDGE_CHUNK_SIZE)
+    ]
+    bridges = {}
+    if num_processes is None:
+        for task in tasks:
+            bridges.update(_bridge_chunk(task, (graph, gwwc_alignments)))
+        return bridges
+
+    arrays = {
+        "node_ids": graph.node_ids,
+        "indptr": graph.indptr,
+        "indices": graph.indices,
+        "gwwc_ids": gwwc_alignments.node_ids,
+        "gwwc_values": gwwc_alignments.values,
+    }
+    if graph.directed:
+        arrays.update(in_indptr=graph.in_indptr, in_indices=graph.in_indices)
+    with SharedArrays(arrays) as handle, Pool(
+        num_processes,
+        initializer=_init_bridge_worker,
+        initargs=(handle, graph.directed, graph.version),
+    ) as pool:
+        for chunk_bridges in pool.imap_unordered(_bridge_chunk, tasks):
+            bridges.update(chunk_bridges)
+    return bridges
+
+
+# Graph and GWWC alignments of a bridge_scores worker process, set by
+# _init_bridge_worker
+_worker_network = None
+
+
+def _init_bridge_worker(handle, directed, version):
+    global _worker_network
+    arrays = attach_arrays(handle)
+    _worker_network = (
+        NetworkEdgeList.from_arrays(
+            arrays["node_ids"],
+            arrays["indptr"],
+            arrays["indices"],
+            arrays.get("in_indptr"),
+            arrays.get("in_indices"),
+            directed=directed,
+            version=version,
+        ),
+        ScoreVector(arrays["gwwc_ids"], arrays["gwwc_values"]),
+    )
+
+
+def _bridge_chunk(task, network=None) -> Dict[int, Dict[int, float]]:
+    target_ids, n = task
+    graph, gwwc_alignments = network or _worker_network
+    connectors = connector_nodes_batch(
+        graph, target_ids, gwwc_alignments=gwwc_alignments
+    )
+    return {target_id: top_n(scores, n) for target_id, scores in connectors.items()}
+
+
+def bridge_report(user_helper: UserHelper, scores: Dict[int, float]) -> str:
+    """Formats connector scores as "username (id): value" lines."""
+    users = user_helper.users_with_values(scores)
+    return "".join(
+        f"{username} ({id}): {value}\n"
+        for id, username, value in zip(
+            users.index.tolist(), users["username"].tolist(), users["value"].tolist()
+        )
+    )
+
+
+def bridge_summary(
+    user_helper: UserHelper, bridges: Dict[int, Dict[int, float]], n: Optional[int]
+) -> str:
+    """
+    Formats the accounts that are among the top connectors of the most targets, with
+    the number of those targets (ties are broken by their total score).
+    """
+    counts = Counter(id for scores in bridges.values() for id in scores)
+    totals = Counter()
+    for scores in bridges.values():
+        totals.update(scores)
+    ranked = sorted(counts, key=lambda id: (-counts[id], -totals[id]))[:n]
+    usernames = user_helper.users.reindex(ranked)["username"].tolist()
+    return f"Most Common Bridges ({len(bridges)} targets)\n" + "".join(
+        f"{username} ({id}): {counts[id]}\n" for id, username in zip(ranked, usernames)
+    )
+
+
+def bridge(
+    handles: List[str] = typer.Argument(
+        None, help="Twitter handles of the target accounts"
+    ),
+    handles_file: Path = typer.Option(
+        None, help="File with more target handles, one per line."
+    ),
+    method: str = typer.Option(
+        "following",
+        help="Analyze 'following' or 'followers' (needs to match files constants.py)",
+    ),
+    n: int = typer.Option(25, help="No. of connectors to list per target"),
+    processes: int = typer.Option(
+        None,
+        help="Number of processes to analyze the targets on (targets are analyzed in a "
+        "single process if omitted).",
+    ),
+    undirected: bool = typer.Option(
+        False, "--undirected", help="Use an undirected graph. (not recommended)"
+    ),
+    out_dir: Path = typer.Option(
+        Path("./results/bridge"),
+        help="Directory to save the reports to (ie. results/bridge/jack-bridge.txt), "
+        "along with summary.txt.",
+    ),
+):
+    handles = list(handles or [])
+    if handles_file is not None:
+        handles += [line.strip() for line in handles_file.open() if line.strip()]
+    out_dir.mkdir(exist_ok=True, parents=True)
+    user_helper = UserHelper(columns=["username"])
+    network_container = NetworkContainer.get_network(
+        directed=not undirected, version=method
+    )
+    graph = network_container.network_edge_list
+
+    ids = user_helper.get_ids(handles)
+    targets = {}
+    for handle, id in ids.items():
+        if graph.index_of(id) < 0:
+            print(f"{handle} is not in the network, skipping.")
+            continue
+        targets[id] = handle
+    print(f"Analyzing {len(targets)} targets.")
+    bridges = bridge_scores(network_container, list(targets), n, processes)
+    for id, scores in bridges.items():
+        with open(out_dir / f"{targets[id]}-bridge.txt", "w") as report_file:
+            report_file.write(bridge_report(user_helper, scores))
+    with open(out_dir / "summary.txt", "w") as summary_file:
+        summary_file.write(bridge_summary(user_helper, bridges, n))
+    print(f"Saved {len(bridges)} reports to {out_dir}.")
+
+
+if __name__ == "__main__":
+    typer.run(bridge)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from neta.constants import NETWORK_CACHE_DIR
+
+FINGERPRINTS_FILE = os.path.join(NETWORK_CACHE_DIR, "fingerprints.json")
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_fingerprint(path) -> str:
+    """
+    Returns a content hash of the file at path. Hashes are memoized on disk keyed by
+    (path, size, mtime), so the file is only read again when it has been modified.
+    Touching a file without changing its contents yields the same fingerprint.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stat_key = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+    fingerprints = _read_fingerprints()
+    if stat_key not in fingerprints:
+        content_hash = hashlib.sha256()
+        with open(path, "rb") as source_file:
+            for block in iter(lambda: source_file.read(HASH_BLOCK_SIZE), b""):
+                content_hash.update(block)
+        # Only the latest state of each file is worth remembering
+        fingerprints = {
+            key: value
+            for key, value in fingerprints.items()
+            if not key.startswith(f"{path}:")
+        }
+        fingerprints[stat_key] = content_hash.hexdigest()
+        _write_fingerprints(fingerprints)
+    return fingerprints[stat_key]
+
+
+def frame_fingerprint(edges: pd.DataFrame) -> str:
+    """Returns a content hash of an in-memory edge frame."""
+    row_hashes = pd.util.hash_pandas_object(
+        edges[["follower", "followed"]], index=False
+    )
+    return hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest()
+
+
+def variant_dir(fingerprint: str, directed: bool) -> str:
+    """
+    Returns the directory holding the cached network built from the edge source with the
+    given fingerprint and build parameters. Different variants live side by side.
+    """
+    variant = f"{fingerprint[:16]}-{'directed' if directed else 'undirected'}"
+    return os.path.join(NETWORK_CACHE_DIR, variant)
+
+
+def _read_fingerprints() -> dict:
+    try:
+        with open(FINGERPRINTS_FILE) as fingerprints_file:
+            return json.load(fingerprints_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_fingerprints(fingerprints: dict):
+    os.makedirs(NETWORK_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{FINGERPRINTS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fingerprints_file:
+        json.dump(fingerprints, fingerprints_file)
+    os.replace(tmp_path, FINGERPRINTS_FILE)
+
+
+def adopt_file_state(path, fingerprint: str):
+    """
+    Records that the current state of the file at path corresponds to the edge source
+    with the given fingerprint plus its delta log. Used after appending to the edge file
+    ourselves, so the appended rows are picked up from the delta log rather than
+    triggering a full rebuild.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    fingerprints = {
+        key: value
+        for key, value in _read_fingerprints().items()
+        if not key.startswith(f"{path}:")
+    }
+    fingerprints[f"{path}:{stat.st_size}:{stat.st_mtime_ns}"] = fingerprint
+    _write_fingerprints(fingerprints)
+
+
+def delta_log_path(fingerprint: str) -> str:
+    """
+    Returns the path of the append-only log of edges added on top of the edge source
+    with the given fingerprint. The log is shared by every cached variant of that source.
+    """
+    return os.path.join(NETWORK_CACHE_DIR, f"{fingerprint[:16]}.delta")
+
+
+def append_delta(fingerprint: str, followers, followed):
+    """Appends (follower, followed) edges to the delta log as raw int64 pairs."""
+    delta = np.column_stack(
+        [np.asarray(followers, dtype="int64"), np.asarray(followed, dtype="int64")]
+    )
+    os.makedirs(NETWORK_CACHE_DIR, exist_ok=True)
+    with open(delta_log_path(fingerprint), "ab") as delta_file:
+        delta_file.write(delta.tobytes())
+
+
+def read_delta(fingerprint: str, start=0):
+    """
+    Returns the (followers, followed) arrays of the delta log, skipping the first start
+    edges. Trailing bytes of a partially written edge are ignored.
+    """
+    try:
+        delta = np.fromfile(delta_log_path(fingerprint), dtype="int64")
+    except FileNotFoundError:
+        delta = np.empty(0, dtype="int64")
+    delta = delta[: len(delta) // 2 * 2].reshape(-1, 2)[start:]
+    return delta[:, 0], delta[:, 1]
@@ -0,0 +1,179 @@
+"""
+Centrality measures computed by power iteration directly on the CSR arrays of a
+network, with float32 vectors. Results are cached next to the cached network, and each
+computation warm-starts from the cached vector, so after adding a batch of edges only a
+few iterations are needed.
+"""
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from neta.graph import NetworkContainer, NetworkEdgeList
+from neta.helpers import ScoreVector
+
+# Convergence threshold on the L1 change of the (normalized) vector, per node
+TOLERANCE = 1e-6
+# HITS converges more slowly, so it needs a tighter threshold (as in nx.hits)
+HITS_TOLERANCE = 1e-8
+MAX_ITERATIONS = 1000
+PAGERANK_DAMPING = 0.85
+
+
+def eigenvector_centrality(
+    network, tol=TOLERANCE, max_iterations=MAX_ITERATIONS, warm_start=True
+) -> ScoreVector:
+    """
+    Eigenvector centrality along the network's default direction (a node is central if
+    central nodes point at it), normalized to unit Euclidean norm like
+    nx.eigenvector_centrality_numpy.
+
+    :param network: A NetworkContainer (whose result is cached) or NetworkEdgeList
+    :param warm_start: Whether to start from the cached vector if there is one
+    """
+    graph, adjacency = _adjacency(network)
+    transposed = adjacency.T.tocsr()
+    (x,) = _initial_vectors(network, "eigenvector", ("values",), warm_start)
+    for _ in range(max_iterations):
+        # Adding x (shifting the spectrum by 1) keeps the iteration from oscillating on
+        # bipartite-like graphs without changing the eigenvector
+        next_x = transposed @ x + x
+        next_x /= np.linalg.norm(next_x) or 1
+        converged = np.abs(next_x - x).sum() < graph.num_nodes * tol
+        x = next_x
+        if converged:
+            break
+    _save_vectors(network, "eigenvector", values=x)
+    return ScoreVector(graph.node_ids, x)
+
+
+def pagerank(
+    network,
+    damping=PAGERANK_DAMPING,
+    tol=TOLERANCE,
+    max_iterations=MAX_ITERATIONS,
+    warm_start=True,
+) -> ScoreVector:
+    """
+    PageRank along the network's default direction, with the mass of nodes without
+    neighbors spread uniformly (as in nx.pagerank). Sums to 1.
+
+    :param network: A NetworkContainer (whose result is cached) or NetworkEdgeList
+    :param warm_start: Whether to start from the cached vector if there is one
+    """
+    graph, adjacency = _adjacency(network)
+    degrees = np.diff(adjacency.indptr).astype("float32")
+    is_dangling = degrees == 0
+    transition = (
+        sparse.diags(
+            np.where(is_dangling, 0, 1 / np.maximum(degrees, 1)).astype("float32")
+        )
+        @ adjacency
+    ).T.tocsr()
+    (x,) = _initial_vectors(network, "pagerank", ("values",), warm_start)
+    x /= x.sum() or 1
+    num_nodes = graph.num_nodes
+    for _ in range(max_iterations):
+        next_x = damping * (transition @ x + x[is_dangling].sum() / num_nodes)
+        next_x += (1 - damping) / num_nodes
+        next_x /= next_x.sum()
+        converged = np.abs(next_x - x).sum() < num_nodes * tol
+        x = next_x
+        if converged:
+            break
+    _save_vectors(network, "pagerank", values=x)
+    return ScoreVector(graph.node_ids, x)
+
+
+def hits(
+    network, tol=HITS_TOLERANCE, max_iterations=MAX_ITERATIONS, warm_start=True
+) -> Tuple[ScoreVector, ScoreVector]:
+    """
+    HITS hub and authority scores along the network's default direction (good hubs
+    point at good authorities), each normalized to sum to 1 like nx.hits.
+
+    :param network: A NetworkContainer (whose result is cached) or NetworkEdgeList
+    :param warm_start: Whether to start from the cached vectors if there are any
+    :return: The hub and the authority scores
+    """
+    graph, adjacency = _adjacency(network)
+    transposed = adjacency.T.tocsr()
+    hubs, authorities = _initial_vectors(
+        network, "hits", ("hubs", "authorities"), warm_start
+    )
+    hubs /= hubs.sum() or 1
+    for _ in range(max_iterations):
+        authorities = transposed @ hubs
+        authorities /= authorities.sum() or 1
+        next_hubs = adjacency @ authorities
+        next_hubs /= next_hubs.sum() or 1
+        converged = np.abs(next_hubs - hubs).sum() < graph.num_nodes * tol
+        hubs = next_hubs
+        if converged:
+            break
+    _save_vectors(network, "hits", hubs=hubs, authorities=authorities)
+    return ScoreVector(graph.node_ids, hubs), ScoreVector(graph.node_ids, authorities)
+
+
+def _adjacency(network) -> Tuple[NetworkEdgeList, sparse.csr_matrix]:
+    graph = (
+        network.network_edge_list if isinstance(network, NetworkContainer) else network
+    )
+    indptr, indices = graph.adjacency()
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(indices), dtype="float32"), indices, indptr),
+        shape=(graph.num_nodes, graph.num_nodes),
+    )
+    return graph, adjacency
+
+
+def _vectors_path(network, measure) -> Optional[str]:
+    if not isinstance(network, NetworkContainer) or network.fingerprint is None:
+        return None
+    return os.path.join(
+        network.cache_dir, "centrality", f"{network.version}-{measure}.npz"
+    )
+
+
+def _initial_vectors(network, measure, names, warm_start):
+    """
+    Returns the cached vectors of the measure mapped onto the current node index (nodes
+    added since get the mean cached value), or uniform vectors.
+    """
+    graph = (
+        network.network_edge_list if isinstance(network, NetworkContainer) else network
+    )
+    vectors_path = _vectors_path(network, measure)
+    if warm_start and vectors_path is not None:
+        try:
+            with np.load(vectors_path) as cached:
+                cached_ids = cached["node_ids"]
+                positions = np.minimum(
+                    np.searchsorted(cached_ids, graph.node_ids),
+                    max(len(cached_ids) - 1, 0),
+                )
+                is_cached = cached_ids[positions] == graph.node_ids
+                vectors = []
+                for name in names:
+                    values = cached[name]
+                    vector = np.full(graph.num_nodes, values.mean(), dtype="float32")
+                    vector[is_cached] = values[positions[is_cached]]
+                    vectors.append(vector)
+                return vectors
+        except (OSError, KeyError, ValueError):
+            pass
+    return [np.ones(graph.num_nodes, dtype="float32") for _ in names]
+
+
+def _save_vectors(network, measure, **vectors: np.ndarray):
+    vectors_path = _vectors_path(network, measure)
+    if vectors_path is None:
+        return
+    graph = network.network_edge_list
+    os.makedirs(os.path.dirname(vectors_path), exist_ok=True)
+    tmp_path = f"{vectors_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as vectors_file:
+        np.savez(vectors_file, node_ids=graph.node_ids, **vectors)
+    os.replace(tmp_path, vectors_path)
@@ -1,12 +1,13 @@
-from collections import defaultdict
+import heapq
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
 
-from math import inf
-from typing import List, Iterable, Dict
+import numpy as np
 
+from neta.distance_index import DistanceIndex
 from neta.graph import NetworkEdgeList, NetworkContainer
-from neta.helpers import UserHelper
+from neta.helpers import ScoreVector, UserHelper
 
-MAX_PATH_LENGTH = 3
+MAX_PATH_LENGTH = 5
 
 Path = List[int]
 
@@ -17,56 +18,382 @@ def get_connector_paths(
     target_node: int,
     n=5,
     max_path_length=MAX_PATH_LENGTH,
+    direction=None,
+    distance_index: Optional[DistanceIndex] = None,
 ) -> List[Path]:
     """
-    Returns the shortest n paths from any of the source_nodes to target_node.
+    Returns the n shortest paths from any of the source_nodes to target_node (fewer if
+    there aren't that many up to max_path_length), as lists of Twitter IDs starting at
+    a source. Paths follow edges from target_node along the given direction ("out" or
+    "in", defaulting to the one matching the graph's version).
+
+    The shortest paths are found with a bidirectional breadth-first search: one from
+    target_node and one from all source nodes together, always expanding the side with
+    the smaller frontier, until they meet or max_path_length is reached. The paths are
+    then read off the distance labels of both searches, which act as parent pointers.
+    If there are fewer than n of them, the list is topped up with the next shortest
+    simple paths (see k_shortest_paths).
+
+    :param distance_index: (optional) a DistanceIndex of the source nodes for this
+        graph, to read the shortest paths off the index instead of searching (unless
+        target_node is one of the source nodes)
     """
+    source_ids = np.unique(np.fromiter(source_nodes, "int64"))
+    if distance_index is not None and not np.array_equal(
+        distance_index.seed_ids, source_ids
+    ):
+        raise ValueError("Distance index is for different source nodes.")
+    # The index only knows a source's distance to itself, so a target among the
+    # sources is searched for like without an index
+    if distance_index is not None and target_node not in source_ids:
+        paths = distance_index.connector_paths(target_node, n, max_path_length)
+    else:
+        paths = _shortest_connector_paths(
+            graph, source_ids, target_node, n, max_path_length, direction
+        )
+    if 0 < len(paths) < n:
+        # All the shortest paths were found, and k_shortest_paths yields them first. A
+        # target among the sources is connected to the other sources.
+        other_source_ids = source_ids[source_ids != target_node]
+        if len(other_source_ids) < len(source_ids):
+            distance_index = None
+        found = {tuple(path) for path in paths}
+        paths += [
+            path
+            for path in k_shortest_paths(
+                graph,
+                other_source_ids,
+                target_node,
+                n,
+                max_path_length=max_path_length,
+                direction=direction,
+                distance_index=distance_index,
+            )
+            if tuple(path) not in found
+        ]
+    return paths
+
+
+def _shortest_connector_paths(
+    graph: NetworkEdgeList,
+    source_ids: np.ndarray,
+    target_node: int,
+    n,
+    max_path_length,
+    direction,
+) -> List[Path]:
+    """Up to n paths of the shortest length, see get_connector_paths."""
+    reverse_direction = (
+        "in" if (direction or graph.default_direction) == "out" else "out"
+    )
+    forward_adjacency = graph.adjacency(direction)
+    backward_adjacency = graph.adjacency(reverse_direction)
+    target_index = graph.index_of(target_node)
+    source_indices = graph.indices_of(source_ids)
+    source_indices = np.unique(
+        source_indices[(source_indices >= 0) & (source_indices != target_index)]
+    )
+    if target_index < 0 or len(source_indices) == 0:
+        return []
+
+    # Hop distances from the target and from the nearest source (-1 if not visited yet)
+    target_distances = np.full(graph.num_nodes, -1, dtype="int16")
+    source_distances = np.full(graph.num_nodes, -1, dtype="int16")
+    target_distances[target_index] = 0
+    source_distances[source_indices] = 0
+    target_frontier, source_frontier = np.array([target_index]), source_indices
+    target_depth = source_depth = 0
+    while target_depth + source_depth < max_path_length:
+        # Expanding the frontier with fewer edges keeps the explored ball small
+        if _frontier_edges(forward_adjacency, target_frontier) <= _frontier_edges(
+            backward_adjacency, source_frontier
+        ):
+            target_depth += 1
+            target_frontier = _expand(
+                forward_adjacency, target_frontier, target_distances, target_depth
+            )
+            if len(target_frontier) == 0:
+                return []
+            meeting = target_frontier[source_distances[target_frontier] >= 0]
+        else:
+            source_depth += 1
+            source_frontier = _expand(
+                backward_adjacency, source_frontier, source_distances, source_depth
+            )
+            if len(source_frontier) == 0:
+                return []
+            meeting = source_frontier[target_distances[source_frontier] >= 0]
+        if len(meeting):
+            break
+    else:
+        return []
+
+    path_length = int(np.min(target_distances[meeting] + source_distances[meeting]))
+    # Every shortest path crosses exactly one node at this distance from the target
+    meeting_distance = min(target_depth, path_length)
+    meeting = np.flatnonzero(
+        (target_distances == meeting_distance)
+        & (source_distances == path_length - meeting_distance)
+    )
     paths = []
-    shortest_path_node_is_in: Dict[int, int] = defaultdict(lambda: inf)
-    # Breadth-first to avoid doing unnecessary exponential searches
-    for path_length in range(1, max_path_length + 1):
-        for source_node in source_nodes:
-            for path_candidate in get_paths_of_length(
-                graph, target_node, source_node, path_length
+    for meeting_index in meeting.tolist():
+        for target_part in _shortest_chains(
+            backward_adjacency, target_distances, meeting_index
+        ):
+            for source_part in _shortest_chains(
+                forward_adjacency, source_distances, meeting_index
             ):
-                should_keep = True
-                for node in path_candidate[:-1]:
-                    if shortest_path_node_is_in[node] < path_length:
-                        should_keep = False
-                        break
-                    shortest_path_node_is_in[node] = min(
-                        shortest_path_node_is_in[node], path_length
-                    )
-                if should_keep:
-                    paths.append(path_candidate[::-1])
-            # print(f"Paths found for {source_node} with max path length {path_length}: {paths_for_source}")
-        if len(paths) >= n:
-            break
-    return paths[:n]
+                paths.append(source_part[::-1] + target_part[1:])
+                if len(paths) >= n:
+                    return [graph.node_ids[path].tolist() for path in paths]
+    return [graph.node_ids[path].tolist() for path in paths]
+
+
+def _frontier_edges(adjacency, frontier) -> int:
+    indptr, _ = adjacency
+    return int((indptr[frontier + 1] - indptr[frontier]).sum())
+
+
+def _expand(adjacency, frontier, distances, depth) -> np.ndarray:
+    """Visits the unvisited neighbors of the frontier at the given depth and returns
+    them as the next frontier."""
+    indptr, indices = adjacency
+    degrees = indptr[frontier + 1] - indptr[frontier]
+    neighbor_positions = np.repeat(
+        indptr[frontier] - np.cumsum(degrees) + degrees, degrees
+    ) + np.arange(degrees.sum())
+    neighbors = np.unique(indices[neighbor_positions])
+    next_frontier = neighbors[distances[neighbors] < 0]
+    distances[next_frontier] = depth
+    return next_frontier
+
+
+def _shortest_chains(adjacency, distances, index) -> Iterator[Path]:
+    """
+    Yields the shortest chains from index down to a node at distance 0, stepping to
+    neighbors (in the given adjacency) one hop closer, as lists of node indices.
+    """
+    if distances[index] == 0:
+        yield [index]
+        return
+    indptr, indices = adjacency
+    neighbors = indices[indptr[index] : indptr[index + 1]]
+    for parent in neighbors[distances[neighbors] == distances[index] - 1].tolist():
+        for chain in _shortest_chains(adjacency, distances, parent):
+            yield [index] + chain
+
+
+def k_shortest_paths(
+    graph: NetworkEdgeList,
+    source_nodes: Iterable[int],
+    target_node: int,
+    k: Optional[int] = None,
+    node_weights: Union[Dict[int, float], ScoreVector, None] = None,
+    max_path_length=MAX_PATH_LENGTH,
+    direction=None,
+    distance_index: Optional[DistanceIndex] = None,
+) -> Iterator[Path]:
+    """
+    Yields the k shortest simple paths from any of the source_nodes to target_node (or
+    all of them up to max_path_length if k is None), in the format of
+    get_connector_paths, lazily and in order of length. Paths of the same length are
+    ordered by the total node_weights of their intermediaries, highest first (e.g. the
+    GWWC alignment of the connectors).
+
+    Uses Yen's algorithm, whose searches are A* searches guided by the hop distances of
+    a DistanceIndex of the sources, so they only visit nodes that can lie on a short
+    enough path. Only the paths yielded so far and up to k candidates are kept.
+
+    :param node_weights: (optional) weights of Twitter IDs, as a dict or ScoreVector
+    :param distance_index: (optional) a DistanceIndex of the source nodes for this
+        graph and direction, which is built if not given
+    """
+    source_ids = np.unique(np.fromiter(source_nodes, "int64"))
+    if distance_index is None:
+        distance_index = DistanceIndex(graph, source_ids, direction)
+    elif not np.array_equal(distance_index.seed_ids, source_ids) or direction not in (
+        None,
+        distance_index.direction,
+    ):
+        raise ValueError("Distance index is for different source nodes or direction.")
+    distances = distance_index.distances
+    target_index = graph.index_of(target_node)
+    if target_index < 0 or not 0 < distances[target_index] <= max_path_length:
+        return
+    adjacency = graph.adjacency(distance_index.direction)
+    penalties = _node_penalties(graph, node_weights)
+    # Sources end a path, so their weight is the same for all paths
+    penalties[distances == 0] = 0
+
+    def cost(path):
+        return len(path) - 1, float(penalties[path[1:]].sum())
+
+    shortest = _a_star(
+        adjacency, distances, penalties, target_index, max_path_length, set(), set()
+    )
+    if shortest is None:
+        return
+    found = [shortest]
+    candidates = []
+    seen = {tuple(shortest)}
+    while True:
+        yield graph.node_ids[found[-1][::-1]].tolist()
+        if k is not None and len(found) >= k:
+            return
+        previous = found[-1]
+        # Deviate from the previous path at each node, avoiding the edges that paths
+        # found already take from the same root
+        for spur_position in range(len(previous) - 1):
+            root = previous[: spur_position + 1]
+            spur_path = _a_star(
+                adjacency,
+                distances,
+                penalties,
+                previous[spur_position],
+                max_path_length - spur_position,
+                set(root[:-1]),
+                {
+                    path[spur_position + 1]
+                    for path in found
+                    if path[: spur_position + 1] == root
+                },
+            )
+            if spur_path is None or tuple(root[:-1] + spur_path) in seen:
+                continue
+            path = root[:-1] + spur_path
+            seen.add(tuple(path))
+            heapq.heappush(candidates, (cost(path), path))
+        if k is not None and len(candidates) > k - len(found):
+            # Candidates beyond the k - len(found) best can never be yielded
+            candidates = heapq.nsmallest(k - len(found), candidates)
+            seen = {tuple(path) for path in found}
+            seen.update(tuple(path) for _, path in candidates)
+        if not candidates:
+            return
+        found.append(heapq.heappop(candidates)[1])
+
+
+def _node_penalties(graph: NetworkEdgeList, node_weights) -> np.ndarray:
+    """
+    Turns node weights into non-negative penalties (the highest weight minus each
+    node's), which rank paths of the same length in the reverse order of their weights.
+    """
+    if node_weights is None:
+        return np.zeros(graph.num_nodes)
+    if not isinstance(node_weights, ScoreVector):
+        node_weights = ScoreVector(
+            np.fromiter(node_weights.keys(), "int64", len(node_weights)),
+            np.fromiter(node_weights.values(), "float64", len(node_weights)),
+        )
+    weights = np.zeros(graph.num_nodes)
+    node_indices = graph.indices_of(node_weights.node_ids)
+    in_graph = node_indices >= 0
+    weights[node_indices[in_graph]] = np.asarray(node_weights.values)[in_graph]
+    return weights.max(initial=0) - weights
+
+
+def _a_star(
+    adjacency,
+    distances,
+    penalties,
+    start: int,
+    max_length: int,
+    blocked_nodes: Set[int],
+    blocked_neighbors: Set[int],
+) -> Optional[Path]:
+    """
+    Returns the cheapest chain of node indices from start to a node at distance 0, by
+    (hops, total penalty), or None if there is none within max_length hops. The
+    distances to the sources are a consistent lower bound on the remaining hops, so
+    the first source taken off the heap is the cheapest one to reach. The chain avoids
+    blocked_nodes and the edges from start to blocked_neighbors.
+    """
+    indptr, indices = adjacency
+    best = {start: (0, 0.0)}
+    parents = {start: -1}
+    heap = [(int(distances[start]), 0.0, 0, start)]
+    while heap:
+        _, penalty, hops, node = heapq.heappop(heap)
+        if (hops, penalty) > best[node]:
+            continue
+        if distances[node] == 0:
+            chain = [node]
+            while parents[chain[-1]] >= 0:
+                chain.append(parents[chain[-1]])
+            return chain[::-1]
+        neighbors = indices[indptr[node] : indptr[node + 1]]
+        lower_bounds = distances[neighbors]
+        neighbors = neighbors[
+            (lower_bounds >= 0) & (lower_bounds + hops + 1 <= max_length)
+        ]
+        for neighbor in neighbors.tolist():
+            if neighbor in blocked_nodes or (
+                node == start and neighbor in blocked_neighbors
+            ):
+                continue
+            neighbor_cost = (hops + 1, penalty + float(penalties[neighbor]))
+            if neighbor not in best or neighbor_cost < best[neighbor]:
+                best[neighbor] = neighbor_cost
+                parents[neighbor] = node
+                heapq.heappush(
+                    heap,
+                    (
+                        hops + 1 + int(distances[neighbor]),
+                        neighbor_cost[1],
+                        hops + 1,
+                        neighbor,
+                    ),
+                )
+    return None
 
 
 def get_paths_of_length(
-    graph: NetworkEdgeList, current_node: int, target_node: int, length: int
+    graph: NetworkEdgeList,
+    current_node: int,
+    target_node: int,
+    length: int,
+    direction=None,
 ) -> List[Path]:
-    if length == 0:
-        if current_node == target_node:
-            return [[current_node]]
+    """
+    Returns all walks of exactly the given length from current_node to target_node, as
+    lists of Twitter IDs.
+    """
+    return [
+        graph.node_ids[path].tolist()
+        for path in _index_paths_of_length(
+            graph,
+            graph.index_of(current_node),
+            graph.index_of(target_node),
+            length,
+            direction,
+        )
+    ]
+
+
+def _index_paths_of_length(
+    graph: NetworkEdgeList,
+    current_index: int,
+    target_index: int,
+    length: int,
+    direction=None,
+) -> List[Path]:
+    """get_paths_of_length on node indices."""
+    if current_index < 0 or target_index < 0:
         return []
-    try:
-        paths = []
-        node_meta = graph.node_metadata[current_node]
-        neighbors = graph.edge_list[node_meta.start : node_meta.end]
-        for neighbor in neighbors:
-            paths.extend(
-                [
-                    [current_node] + path
-                    for path in get_paths_of_length(
-                        graph, neighbor, target_node, length - 1
-                    )
-                ]
-            )
-    except KeyError:
+    if length == 0:
+        if current_index == target_index:
+            return [[current_index]]
         return []
+    paths = []
+    for neighbor in graph.neighbor_indices(current_index, direction):
+        paths.extend(
+            [
+                [current_index] + path
+                for path in _index_paths_of_length(
+                    graph, int(neighbor), target_index, length - 1, direction
+                )
+            ]
+        )
     return paths
 
 
@@ -0,0 +1,254 @@
+"""
+Index of every node's hop distance to a set of seed nodes (e.g. GWWC_NODES), with
+pointers to the neighbors one hop closer, so the shortest connector paths to any node
+can be read off without searching the graph.
+"""
+
+import hashlib
+import json
+import os
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from neta.cache import read_delta
+from neta.graph import NetworkContainer, NetworkEdgeList
+
+INDEX_ARRAYS = ("node_ids", "distances", "parent_indptr", "parent_indices")
+
+
+class DistanceIndex:
+    """
+    Result of one breadth-first search from all seed nodes together, against the given
+    direction, so distances[i] is the length of the shortest path from node i to any
+    seed along the direction (-1 if there is none). The parents of node i, i.e. its
+    neighbors one hop closer to the seeds, are
+    parent_indices[parent_indptr[i]:parent_indptr[i + 1]].
+    """
+
+    seed_ids: np.ndarray
+    direction: str
+    node_ids: np.ndarray
+    distances: np.ndarray
+    parent_indptr: np.ndarray
+    parent_indices: np.ndarray
+
+    def __init__(self, graph: NetworkEdgeList, seed_ids: Iterable[int], direction=None):
+        self.seed_ids = np.unique(np.fromiter(seed_ids, dtype="int64"))
+        self.direction = direction or graph.default_direction
+        self.node_ids = graph.node_ids
+        self.distances = np.full(graph.num_nodes, -1, dtype="int16")
+        seed_indices = graph.indices_of(self.seed_ids)
+        seed_indices = seed_indices[seed_indices >= 0]
+        self.distances[seed_indices] = 0
+        self._relax(graph, seed_indices)
+        self.parent_indptr, self.parent_indices = self._parents(
+            graph, np.arange(graph.num_nodes)
+        )
+
+    def _reverse_adjacency(self, graph: NetworkEdgeList):
+        return graph.adjacency("in" if self.direction == "out" else "out")
+
+    def _relax(self, graph: NetworkEdgeList, frontier: np.ndarray):
+        """
+        Lowers distances by searching against the direction from the frontier nodes,
+        whose distances are final or were just lowered, until nothing improves. From the
+        seeds alone, this is a plain breadth-first search.
+        """
+        indptr, indices = self._reverse_adjacency(graph)
+        frontier = frontier[self.distances[frontier] >= 0]
+        while len(frontier):
+            owners, neighbors = _gather_neighbors(indptr, indices, frontier)
+            candidates = self.distances[frontier][owners] + 1
+            current = self.distances[neighbors]
+            improves = (current < 0) | (candidates < current)
+            neighbors, candidates = neighbors[improves], candidates[improves]
+            new_distances = np.full(graph.num_nodes, np.iinfo("int16").max, "int16")
+            np.minimum.at(new_distances, neighbors, candidates)
+            frontier = np.unique(neighbors)
+            self.distances[frontier] = new_distances[frontier]
+
+    def _parents(self, graph: NetworkEdgeList, rows: np.ndarray):
+        """Returns the parents of the given nodes as CSR arrays over rows."""
+        indptr, indices = graph.adjacency(self.direction)
+        rows = rows[self.distances[rows] > 0]
+        owners, neighbors = _gather_neighbors(indptr, indices, rows)
+        is_parent = self.distances[neighbors] == self.distances[rows][owners] - 1
+        parent_indptr = np.zeros(graph.num_nodes + 1, dtype="int64")
+        np.cumsum(
+            np.bincount(rows[owners[is_parent]], minlength=graph.num_nodes),
+            out=parent_indptr[1:],
+        )
+        return parent_indptr, neighbors[is_parent].astype("int32")
+
+    def update(self, graph: NetworkEdgeList, followers, followed):
+        """
+        Updates the index for graph, which is the indexed graph plus the given (follower,
+        followed) edges. New edges can only shorten distances, so only the nodes whose
+        distance drops and their neighbors are revisited.
+        """
+        followers = np.asarray(followers, dtype="int64")
+        followed = np.asarray(followed, dtype="int64")
+        # Carry the index over to the new graph's node index
+        old_to_new = graph.indices_of(self.node_ids)
+        old_distances = np.full(graph.num_nodes, -1, dtype="int16")
+        old_distances[old_to_new] = self.distances
+        old_parent_rows = np.repeat(old_to_new, np.diff(self.parent_indptr))
+        old_parents = old_to_new[self.parent_indices]
+        self.node_ids = graph.node_ids
+        self.distances = old_distances.copy()
+
+        # Seeds that just joined the graph, and sources of new edges into reached nodes
+        seed_indices = graph.indices_of(self.seed_ids)
+        new_seeds = seed_indices[
+            (seed_indices >= 0) & (self.distances[np.maximum(seed_indices, 0)] != 0)
+        ]
+        self.distances[new_seeds] = 0
+        sources, targets = followers, followed
+        if self.direction == "in":
+            sources, targets = followed, followers
+        if not graph.directed:
+            sources, targets = (
+                np.concatenate([sources, targets]),
+                np.concatenate([targets, sources]),
+            )
+        sources, targets = graph.indices_of(sources), graph.indices_of(targets)
+        self._relax(graph, np.unique(np.concatenate([new_seeds, targets])))
+
+        changed = np.flatnonzero(self.distances != old_distances)
+        reverse_indptr, reverse_indices = self._reverse_adjacency(graph)
+        _, changed_neighbors = _gather_neighbors(
+            reverse_indptr, reverse_indices, changed
+        )
+        affected = np.unique(np.concatenate([changed, changed_neighbors, sources]))
+        is_affected = np.zeros(graph.num_nodes, dtype=bool)
+        is_affected[affected] = True
+        kept = ~is_affected[old_parent_rows]
+        new_indptr, new_parents = self._parents(graph, affected)
+        new_rows = np.repeat(np.arange(graph.num_nodes), np.diff(new_indptr))
+        rows = np.concatenate([old_parent_rows[kept], new_rows])
+        parents = np.concatenate([old_parents[kept], new_parents])
+        order = np.lexsort((parents, rows))
+        self.parent_indptr = np.zeros(graph.num_nodes + 1, dtype="int64")
+        np.cumsum(
+            np.bincount(rows, minlength=graph.num_nodes), out=self.parent_indptr[1:]
+        )
+        self.parent_indices = parents[order].astype("int32")
+
+    def shortest_chains(self, index: int) -> Iterator[List[int]]:
+        """Yields the shortest chains of node indices from index to a seed."""
+        if self.distances[index] == 0:
+            yield [index]
+            return
+        for parent in self.parent_indices[
+            self.parent_indptr[index] : self.parent_indptr[index + 1]
+        ].tolist():
+            for chain in self.shortest_chains(parent):
+                yield [index] + chain
+
+    def connector_paths(
+        self, target_node: int, n=5, max_path_length: Optional[int] = None
+    ) -> List[List[int]]:
+        """
+        Returns up to n shortest paths between the seeds and target_node, in the format
+        of get_connector_paths (Twitter IDs, starting at a seed). A seed is at distance
+        0 from itself, so there are none for a seed target.
+        """
+        position = int(np.searchsorted(self.node_ids, target_node))
+        if position == len(self.node_ids) or self.node_ids[position] != target_node:
+            return []
+        distance = self.distances[position]
+        if distance <= 0 or (
+            max_path_length is not None and distance > max_path_length
+        ):
+            return []
+        paths = []
+        for chain in self.shortest_chains(position):
+            paths.append(self.node_ids[chain[::-1]].tolist())
+            if len(paths) >= n:
+                break
+        return paths
+
+    def save(self, index_dir, **header_fields):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            array_path = os.path.join(index_dir, f"{name}.npy")
+            tmp_path = f"{array_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as array_file:
+                np.save(array_file, getattr(self, name))
+            os.replace(tmp_path, array_path)
+        header_path = os.path.join(index_dir, "header.json")
+        with open(f"{header_path}.{os.getpid()}.tmp", "w") as header_file:
+            json.dump(
+                {
+                    "seed_ids": self.seed_ids.tolist(),
+                    "direction": self.direction,
+                    **header_fields,
+                },
+                header_file,
+            )
+        os.replace(f"{header_path}.{os.getpid()}.tmp", header_path)
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, "header.json")) as header_file:
+            header = json.load(header_file)
+        index = cls.__new__(cls)
+        index.seed_ids = np.array(header["seed_ids"], dtype="int64")
+        index.direction = header["direction"]
+        for name in INDEX_ARRAYS:
+            setattr(index, name, np.load(os.path.join(index_dir, f"{name}.npy")))
+        return index, header
+
+    @classmethod
+    def for_network(
+        cls,
+        network_container: NetworkContainer,
+        seed_ids: Iterable[int],
+        direction=None,
+    ):
+        """
+        Returns the index of the seeds for a network. It is persisted next to the cached
+        network and, when edges have been added to the delta log since it was saved,
+        updated with just those edges.
+        """
+        graph = network_container.network_edge_list
+        seed_ids = np.unique(np.fromiter(seed_ids, dtype="int64"))
+        direction = direction or graph.default_direction
+        if network_container.fingerprint is None:
+            return cls(graph, seed_ids, direction)
+        seeds_hash = hashlib.sha256(seed_ids.tobytes()).hexdigest()[:16]
+        index_dir = os.path.join(
+            network_container.cache_dir,
+            "distances",
+            f"{network_container.version}-{direction}-{seeds_hash}",
+        )
+        try:
+            index, header = cls.load(index_dir)
+            indexed_delta = header["delta_edges"]
+            if indexed_delta == network_container.delta_edges:
+                return index
+            if indexed_delta < network_container.delta_edges:
+                followers, followed = read_delta(
+                    network_container.fingerprint, start=indexed_delta
+                )
+                followers = followers[: network_container.delta_edges - indexed_delta]
+                followed = followed[: network_container.delta_edges - indexed_delta]
+                index.update(graph, followers, followed)
+                index.save(index_dir, delta_edges=network_container.delta_edges)
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        print("Building distance index.")
+        index = cls(graph, seed_ids, direction)
+        index.save(index_dir, delta_edges=network_container.delta_edges)
+        return index
+
+
+def _gather_neighbors(indptr, indices, rows):
+    """Returns the neighbors of the given rows, and the position in rows each one
+    belongs to."""
+    degrees = indptr[rows + 1] - indptr[rows]
+    positions = np.repeat(indptr[rows] - np.cumsum(degrees) + degrees, degrees)
+    positions += np.arange(degrees.sum())
+    return np.repeat(np.arange(len(rows)), degrees), indices[positions]
@@ -1,74 +1,680 @@
+import json
 import os
-import pickle
-from collections import defaultdict
-from typing import Dict, NamedTuple
+import threading
+from typing import NamedTuple, Optional
 
 import networkx as nx
 import numpy as np
-import pandas as pd
 
-from neta.constants import EDGE_CSV_PATH, NETWORK_CACHE_PATH
+from neta.cache import (
+    append_delta,
+    file_fingerprint,
+    frame_fingerprint,
+    read_delta,
+    variant_dir,
+)
+from neta.constants import EDGE_CSV_PATH
+from neta.loaders import load_edges, load_users
 
+# Bump whenever the on-disk layout of a cached NetworkEdgeList changes, so that caches
+# written by older code are rebuilt instead of misread.
+CACHE_FORMAT_VERSION = 3
+CACHE_ARRAYS = ("node_ids", "indptr", "indices", "in_indptr", "in_indices")
+# The in-adjacency of an undirected edge list is the out-adjacency, so it isn't stored
+UNDIRECTED_CACHE_ARRAYS = CACHE_ARRAYS[:3]
+# Number of delta-log edges not yet folded into a cached base after which loading the
+# network kicks off a background compaction
+COMPACTION_THRESHOLD = 20000
 
-class NodeMetadata(NamedTuple):
-    start: int
-    end: int
-    length: int
+
+def build_csr(sources, targets, directed=True):
+    """
+    Builds a compressed sparse row (CSR) adjacency from parallel arrays of source and
+    target Twitter IDs, using only vectorized NumPy operations.
+
+    IDs are remapped to a dense, contiguous int32 index space (the position of each ID
+    in the sorted array of unique IDs). Edges are sorted once by (source, target) and
+    duplicates are dropped, so each node's neighbors are a sorted, unique slice.
+
+    :param sources: Array-like of source node IDs
+    :param targets: Array-like of target node IDs
+    :param directed: If False, every edge is also added in the reverse direction
+    :return: A tuple (node_ids, indptr, indices) where node_ids[i] is the Twitter ID of
+        node i, and the neighbors of node i are indices[indptr[i]:indptr[i + 1]]
+    """
+    sources = np.asarray(sources, dtype="int64")
+    targets = np.asarray(targets, dtype="int64")
+    node_ids = np.unique(np.concatenate([sources, targets]))
+    num_nodes = len(node_ids)
+    source_indices = np.searchsorted(node_ids, sources)
+    target_indices = np.searchsorted(node_ids, targets)
+    if not directed:
+        source_indices, target_indices = (
+            np.concatenate([source_indices, target_indices]),
+            np.concatenate([target_indices, source_indices]),
+        )
+
+    # A single sort on the combined (source, target) key groups edges by source and
+    # orders each neighbor slice, which also makes duplicate edges adjacent.
+    edge_keys = source_indices * num_nodes + target_indices
+    edge_keys = edge_keys[np.argsort(edge_keys)]
+    is_unique = np.ones(len(edge_keys), dtype=bool)
+    is_unique[1:] = edge_keys[1:] != edge_keys[:-1]
+    edge_keys = edge_keys[is_unique]
+
+    indptr = np.zeros(num_nodes + 1, dtype="int64")
+    np.cumsum(np.bincount(edge_keys // num_nodes, minlength=num_nodes), out=indptr[1:])
+    indices = (edge_keys % num_nodes).astype("int32")
+    return node_ids, indptr, indices
+
+
+def transpose_csr(indptr, indices):
+    """
+    Returns the (indptr, indices) of the transposed adjacency, i.e. the CSC form of the
+    given CSR arrays. A stable sort by target keeps each transposed row sorted.
+    """
+    num_nodes = len(indptr) - 1
+    sources = np.repeat(np.arange(num_nodes, dtype="int32"), np.diff(indptr))
+    in_indices = sources[np.argsort(indices, kind="stable")]
+    in_indptr = np.zeros(num_nodes + 1, dtype="int64")
+    np.cumsum(np.bincount(indices, minlength=num_nodes), out=in_indptr[1:])
+    return in_indptr, in_indices
+
+
+def splice_edges(node_ids, indptr, indices, sources, targets):
+    """
+    Returns (node_ids, indptr, indices) with the given (source, target) ID edges added
+    to the CSR arrays. Edges that are already present are skipped. The new edges are
+    spliced into the existing arrays without re-sorting them, so the cost is a linear
+    copy rather than a full rebuild.
+    """
+    # Splice any previously unseen IDs into the sorted node_ids (as empty rows) and
+    # shift the existing adjacency to the new index space
+    endpoint_ids = np.unique(np.concatenate([sources, targets]))
+    is_new = np.ones(len(endpoint_ids), dtype=bool)
+    if len(node_ids):
+        known_positions = np.minimum(
+            np.searchsorted(node_ids, endpoint_ids), len(node_ids) - 1
+        )
+        is_new = node_ids[known_positions] != endpoint_ids
+    new_ids = endpoint_ids[is_new]
+    new_id_positions = np.searchsorted(node_ids, new_ids)
+    old_node_ids, node_ids = node_ids, np.insert(node_ids, new_id_positions, new_ids)
+    degrees = np.insert(np.diff(indptr), new_id_positions, 0)
+    indices = np.asarray(indices)
+    if len(new_ids):
+        index_shift = np.searchsorted(new_ids, old_node_ids)
+        old_to_new = np.arange(len(old_node_ids), dtype="int64") + index_shift
+        indices = old_to_new[indices].astype("int32")
+
+    num_nodes = len(node_ids)
+    edge_keys = np.unique(
+        np.searchsorted(node_ids, sources) * num_nodes
+        + np.searchsorted(node_ids, targets)
+    )
+    new_sources, new_targets = edge_keys // num_nodes, edge_keys % num_nodes
+    # Rows are sorted and laid out in order, so the existing edges' keys are sorted too
+    # and one binary search gives each new edge's insertion point in indices, which also
+    # tells us whether the edge is already there
+    existing_keys = (
+        np.repeat(np.arange(num_nodes, dtype="int64"), degrees) * num_nodes + indices
+    )
+    positions = np.searchsorted(existing_keys, edge_keys)
+    keep = np.ones(len(edge_keys), dtype=bool)
+    in_range = positions < len(existing_keys)
+    keep[in_range] = existing_keys[positions[in_range]] != edge_keys[in_range]
+
+    indices = np.insert(indices, positions[keep], new_targets[keep])
+    degrees += np.bincount(new_sources[keep], minlength=num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype="int64")
+    np.cumsum(degrees, out=indptr[1:])
+    return node_ids, indptr, indices.astype("int32")
+
+
+class PruningConfig(NamedTuple):
+    """
+    Degree-based pruning of the walk adjacency (see NetworkEdgeList.pruned), in the
+    spirit of Pixie's graph pruning. Rules left as None are not applied.
+    """
+
+    # Drop every edge into a hub, i.e. a node with more than this many edges pointing at
+    # it along the walk direction (e.g. followers, for the "following" version)
+    max_hub_degree: Optional[int] = None
+    # Keep at most this many neighbors per node
+    max_degree: Optional[int] = None
+    # Pixie's pruning factor: keep at most ceil(degree ** degree_exponent) neighbors per
+    # node, which trims high-degree nodes much harder than low-degree ones
+    degree_exponent: Optional[float] = None
+    # Which neighbors a capped node keeps: those with the highest "followers_count" in
+    # the users file, or the highest "hub_degree" in the graph
+    rank_by: str = "followers_count"
+
+    @property
+    def key(self) -> str:
+        """Identifies the configuration in cache paths."""
+        return (
+            f"hub{self.max_hub_degree}-max{self.max_degree}"
+            f"-exp{self.degree_exponent}-{self.rank_by}"
+        )
 
 
 class NetworkEdgeList:
     """
     An alternative representation of a network that is optimized for random sampling of
     neighbors.
+
+    Nodes are addressed by a dense index into node_ids (which is sorted, so IDs can be
+    mapped to indices with a binary search). Both directions are kept: the accounts
+    node i follows are indices[indptr[i]:indptr[i + 1]] (direction "out"), and the
+    accounts following it are in_indices[in_indptr[i]:in_indptr[i + 1]] (direction
+    "in"). Methods taking a direction default to the one matching version: "out" for
+    "following" and "in" for "followers".
     """
 
-    edge_list: np.array
-    node_metadata: Dict[int, NodeMetadata]
+    node_ids: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    in_indptr: np.ndarray
+    in_indices: np.ndarray
+    directed: bool
+    version: str
 
     def __init__(self, edges, directed=True, version="following"):
-        source = "follower" if version == "following" else "followed"
-        target = "followed" if version == "following" else "follower"
-        neighbor_dict = (
-            edges.groupby(source)
-            .apply(lambda x: list(x[target]))
-            .to_dict(into=defaultdict(list))
+        node_ids, indptr, indices = build_csr(
+            edges["follower"].to_numpy(), edges["followed"].to_numpy(), directed
+        )
+        self._set_arrays(node_ids, indptr, indices, directed, version)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        node_ids,
+        indptr,
+        indices,
+        in_indptr=None,
+        in_indices=None,
+        directed=True,
+        version="following",
+    ):
+        network_edge_list = cls.__new__(cls)
+        network_edge_list._set_arrays(
+            node_ids, indptr, indices, directed, version, in_indptr, in_indices
         )
-        n = len(edges)
+        return network_edge_list
+
+    def _set_arrays(
+        self,
+        node_ids,
+        indptr,
+        indices,
+        directed,
+        version,
+        in_indptr=None,
+        in_indices=None,
+    ):
+        self.node_ids = node_ids
+        self.indptr = indptr
+        self.indices = indices
         if not directed:
-            edges.apply(lambda x: neighbor_dict[x[target]].append(x[source]), axis=1)
-            n *= 2
-
-        self.edge_list = np.empty(n, dtype="int64")
-        self.node_metadata = {}
-
-        prev_index = 0
-        for node, neighbors in neighbor_dict.items():
-            np_neighbors = np.array(neighbors, dtype="int64")
-            start_idx = prev_index
-            end_idx = start_idx + len(neighbors)
-            self.node_metadata[node] = NodeMetadata(
-                start=start_idx, end=end_idx, length=len(neighbors)
+            in_indptr, in_indices = indptr, indices
+        elif in_indptr is None:
+            in_indptr, in_indices = transpose_csr(indptr, indices)
+        self.in_indptr = in_indptr
+        self.in_indices = in_indices
+        self.directed = directed
+        self.version = version
+
+    @property
+    def default_direction(self) -> str:
+        return "out" if self.version == "following" else "in"
+
+    def adjacency(self, direction=None):
+        """Returns the (indptr, indices) arrays for the given direction."""
+        if (direction or self.default_direction) == "out":
+            return self.indptr, self.indices
+        return self.in_indptr, self.in_indices
+
+    def save(self, cache_dir, **header_fields):
+        """
+        Writes the edge list to cache_dir as raw .npy arrays plus a JSON header. Each
+        save writes a new generation of array files and then atomically swaps in a
+        header pointing at them, so readers never see a half-written cache and arrays
+        that other processes have memory-mapped stay intact.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            generation = NetworkEdgeList.read_header(cache_dir)["generation"] + 1
+        except (OSError, ValueError, KeyError):
+            generation = 0
+        for name in self.cache_arrays(self.directed):
+            array_path = os.path.join(cache_dir, f"{name}.{generation}.npy")
+            tmp_path = f"{array_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as array_file:
+                np.save(array_file, getattr(self, name))
+            os.replace(tmp_path, array_path)
+        header = {
+            "format_version": CACHE_FORMAT_VERSION,
+            "generation": generation,
+            "directed": self.directed,
+            "num_nodes": self.num_nodes,
+            "num_edges": self.num_edges,
+            **header_fields,
+        }
+        header_path = os.path.join(cache_dir, "header.json")
+        tmp_path = f"{header_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as header_file:
+            json.dump(header, header_file)
+        os.replace(tmp_path, header_path)
+        # Keep the previous generation around for readers that loaded its header just
+        # before the swap
+        for file_name in os.listdir(cache_dir):
+            parts = file_name.split(".")
+            if (
+                len(parts) == 3
+                and parts[0] in CACHE_ARRAYS
+                and int(parts[1]) < generation - 1
+            ):
+                os.remove(os.path.join(cache_dir, file_name))
+
+    @staticmethod
+    def cache_arrays(directed):
+        return CACHE_ARRAYS if directed else UNDIRECTED_CACHE_ARRAYS
+
+    @staticmethod
+    def read_header(cache_dir) -> dict:
+        with open(os.path.join(cache_dir, "header.json")) as header_file:
+            header = json.load(header_file)
+        if header.get("format_version") != CACHE_FORMAT_VERSION:
+            raise ValueError(
+                f"Cache format {header.get('format_version')} is not supported "
+                f"(expected {CACHE_FORMAT_VERSION})."
             )
-            self.edge_list[start_idx:end_idx] = np_neighbors
-            prev_index = end_idx
+        return header
+
+    @classmethod
+    def load(cls, cache_dir, version="following", mmap_mode="r"):
+        """
+        Loads an edge list written by save(). By default the arrays are memory-mapped
+        read-only, so loading is near-instant and processes reading the same cache share
+        pages through the OS page cache.
+        """
+        header = cls.read_header(cache_dir)
+        arrays = {
+            name: np.load(
+                os.path.join(cache_dir, f"{name}.{header['generation']}.npy"),
+                mmap_mode=mmap_mode,
+            )
+            for name in cls.cache_arrays(header["directed"])
+        }
+        if len(arrays["node_ids"]) != header["num_nodes"] or (
+            len(arrays["indices"]) != header["num_edges"]
+        ):
+            raise ValueError("Cached arrays do not match the cache header.")
+        return cls.from_arrays(directed=header["directed"], version=version, **arrays)
+
+    def edge_arrays(self):
+        """Returns the (follower, followed) Twitter IDs of every edge in the edge list."""
+        sources = np.repeat(self.node_ids, np.diff(self.indptr))
+        return sources, self.node_ids[self.indices]
+
+    def with_edges(self, followers, followed):
+        """
+        Returns a new edge list containing this edge list's edges plus the given
+        (follower, followed) ones. Edges that are already present are skipped, so
+        applying the same edges twice is harmless.
+        """
+        followers = np.asarray(followers, dtype="int64")
+        followed = np.asarray(followed, dtype="int64")
+        if not self.directed:
+            followers, followed = (
+                np.concatenate([followers, followed]),
+                np.concatenate([followed, followers]),
+            )
+            node_ids, indptr, indices = splice_edges(
+                self.node_ids, self.indptr, self.indices, followers, followed
+            )
+            return NetworkEdgeList.from_arrays(
+                node_ids, indptr, indices, directed=False, version=self.version
+            )
+        node_ids, indptr, indices = splice_edges(
+            self.node_ids, self.indptr, self.indices, followers, followed
+        )
+        _, in_indptr, in_indices = splice_edges(
+            self.node_ids, self.in_indptr, self.in_indices, followed, followers
+        )
+        return NetworkEdgeList.from_arrays(
+            node_ids,
+            indptr,
+            indices,
+            in_indptr,
+            in_indices,
+            directed=True,
+            version=self.version,
+        )
+
+    def pruned(
+        self,
+        max_hub_degree=None,
+        max_degree=None,
+        degree_exponent=None,
+        neighbor_scores=None,
+    ):
+        """
+        Returns a copy of the edge list with edges pruned along the default direction
+        (see PruningConfig for the rules). Node indices are unchanged, so nodes can end
+        up without neighbors.
+
+        :param neighbor_scores: (optional) score of each node, aligned with node_ids;
+            capped nodes keep their highest-scoring neighbors. Defaults to hub degree.
+        """
+        direction = self.default_direction
+        indptr, indices = self.adjacency(direction)
+        hub_degrees = self.degrees("in" if direction == "out" else "out")
+        degrees = np.diff(indptr)
+        sources = np.repeat(np.arange(self.num_nodes, dtype="int64"), degrees)
+        keep = np.ones(self.num_edges, dtype=bool)
+        if max_hub_degree is not None:
+            keep &= hub_degrees[indices] <= max_hub_degree
+        if max_degree is not None or degree_exponent is not None:
+            allowance = np.full(self.num_nodes, self.num_edges, dtype="int64")
+            if max_degree is not None:
+                allowance = np.minimum(allowance, max_degree)
+            if degree_exponent is not None:
+                allowance = np.minimum(
+                    allowance, np.ceil(degrees**degree_exponent).astype("int64")
+                )
+            if neighbor_scores is None:
+                neighbor_scores = hub_degrees
+            # Within each row, surviving edges come first, by descending neighbor score
+            order = np.lexsort(
+                (-np.asarray(neighbor_scores, dtype="float64")[indices], ~keep, sources)
+            )
+            row_ranks = np.empty(self.num_edges, dtype="int64")
+            row_ranks[order] = np.arange(self.num_edges) - indptr[sources[order]]
+            keep &= row_ranks < allowance[sources]
+        if not self.directed:
+            # An undirected edge survives only if both of its endpoints keep it
+            kept_keys = sources[keep] * self.num_nodes + indices[keep]
+            if len(kept_keys) == 0:
+                keep[:] = False
+            else:
+                reverse_keys = indices.astype("int64") * self.num_nodes + sources
+                positions = np.minimum(
+                    np.searchsorted(kept_keys, reverse_keys), len(kept_keys) - 1
+                )
+                keep &= kept_keys[positions] == reverse_keys
+
+        pruned_indptr = np.zeros(self.num_nodes + 1, dtype="int64")
+        np.cumsum(
+            np.bincount(sources[keep], minlength=self.num_nodes), out=pruned_indptr[1:]
+        )
+        pruned_indices = np.asarray(indices[keep], dtype="int32")
+        if not self.directed:
+            return NetworkEdgeList.from_arrays(
+                self.node_ids,
+                pruned_indptr,
+                pruned_indices,
+                directed=False,
+                version=self.version,
+            )
+        reverse_indptr, reverse_indices = transpose_csr(pruned_indptr, pruned_indices)
+        if direction == "in":
+            pruned_indptr, pruned_indices, reverse_indptr, reverse_indices = (
+                reverse_indptr,
+                reverse_indices,
+                pruned_indptr,
+                pruned_indices,
+            )
+        return NetworkEdgeList.from_arrays(
+            self.node_ids,
+            pruned_indptr,
+            pruned_indices,
+            reverse_indptr,
+            reverse_indices,
+            directed=True,
+            version=self.version,
+        )
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def index_of(self, node_id) -> int:
+        """Returns the index of the given Twitter ID, or -1 if it is not in the graph."""
+        index = int(np.searchsorted(self.node_ids, node_id))
+        if index < self.num_nodes and self.node_ids[index] == node_id:
+            return index
+        return -1
+
+    def indices_of(self, node_ids) -> np.ndarray:
+        """Vectorized index_of: maps an array of Twitter IDs to indices (-1 if missing)."""
+        node_ids = np.asarray(node_ids, dtype="int64")
+        if self.num_nodes == 0:
+            return np.full(node_ids.shape, -1, dtype="int64")
+        node_indices = np.searchsorted(self.node_ids, node_ids)
+        node_indices[node_indices == self.num_nodes] = 0
+        return np.where(self.node_ids[node_indices] == node_ids, node_indices, -1)
+
+    def neighbor_indices(self, index: int, direction=None) -> np.ndarray:
+        indptr, indices = self.adjacency(direction)
+        return indices[indptr[index] : indptr[index + 1]]
+
+    def neighbors(self, node_id, direction=None) -> np.ndarray:
+        """Returns the Twitter IDs of the given node's neighbors."""
+        index = self.index_of(node_id)
+        if index < 0:
+            return np.empty(0, dtype="int64")
+        return self.node_ids[self.neighbor_indices(index, direction)]
+
+    def degrees(self, direction=None) -> np.ndarray:
+        return np.diff(self.adjacency(direction)[0])
+
+    def degree(self, node_id, direction=None) -> int:
+        index = self.index_of(node_id)
+        if index < 0:
+            return 0
+        indptr = self.adjacency(direction)[0]
+        return int(indptr[index + 1] - indptr[index])
 
 
 class NetworkContainer:
-    network: nx.Graph
     network_edge_list: NetworkEdgeList
     version: str
+    fingerprint: str
+    # Number of edges from the delta log reflected in memory, and in the cached base
+    delta_edges: int
+    compacted_delta: int
+    # Pruning applied to the edge list, if any (see pruned)
+    pruning: Optional[PruningConfig]
 
-    def __init__(self, directed=False, version="following", edges=None):
-        if edges is None:
-            edges = pd.read_csv(EDGE_CSV_PATH)
-        self.network = self.construct_network(edges, directed, version)
-        self.network_edge_list = NetworkEdgeList(edges, directed, version)
+    def __init__(
+        self,
+        directed=False,
+        version="following",
+        edges=None,
+        network_edge_list=None,
+        fingerprint=None,
+        compacted_delta=0,
+    ):
+        """
+        :param edges: (optional) dataframe of edges, loaded from EDGE_CSV_PATH if omitted
+        :param network_edge_list: (optional) prebuilt edge list, e.g. loaded from cache
+        :param fingerprint: (optional) content hash of the edge source, used to key the
+            cache (see get_network). Without one, the container is kept in memory only:
+            it never touches the delta log or the cache.
+        :param compacted_delta: number of delta-log edges already contained in a
+            prebuilt edge list
+        """
+        if network_edge_list is None:
+            if edges is None:
+                edges = load_edges()
+            network_edge_list = NetworkEdgeList(edges, directed, version)
+        self.network_edge_list = network_edge_list
+        self._network = None
         self.version = version
+        self.fingerprint = fingerprint
+        self.delta_edges = compacted_delta
+        self.compacted_delta = compacted_delta
+        self._compaction = None
+        self.pruning = None
+
+    @property
+    def network(self) -> nx.Graph:
+        """
+        The networkx view of the network. It is by far the largest representation, and
+        array-based workflows (connectors, random walks) never need it, so it is only
+        built from the edge list on first access.
+        """
+        if self._network is None:
+            self._network = self.construct_network(self.network_edge_list)
+        return self._network
+
+    def orient(self, followers, followed):
+        """Orients (follower, followed) edges as (source, target) for this version."""
+        if self.version == "following":
+            return followers, followed
+        return followed, followers
+
+    def add_edges(self, followers, followed):
+        """
+        Adds (follower, followed) edges to both the networkx graph and the edge list
+        (in both directions), and records them in the delta log so later loads pick
+        them up without a full re-cache.
+        """
+        if self.pruning is not None:
+            raise ValueError(
+                "Can't add edges to a pruned network: add them to the full network "
+                "and prune it again."
+            )
+        followers = np.asarray(followers, dtype="int64")
+        followed = np.asarray(followed, dtype="int64")
+        if self.fingerprint is not None:
+            append_delta(self.fingerprint, followers, followed)
+            self.delta_edges += len(followers)
+        self._add_to_memory(followers, followed)
+
+    def apply_delta_log(self):
+        """Applies delta-log edges that aren't reflected in memory yet."""
+        followers, followed = read_delta(self.fingerprint, start=self.delta_edges)
+        if len(followers):
+            self._add_to_memory(followers, followed)
+            self.delta_edges += len(followers)
+
+    def _add_to_memory(self, followers, followed):
+        if self._network is not None:
+            sources, targets = self.orient(followers, followed)
+            self._network.add_edges_from(zip(sources.tolist(), targets.tolist()))
+        self.network_edge_list = self.network_edge_list.with_edges(followers, followed)
+
+    @property
+    def cache_dir(self) -> str:
+        cache_dir = variant_dir(self.fingerprint, self.network_edge_list.directed)
+        if self.pruning is not None:
+            return os.path.join(
+                cache_dir, "pruned", f"{self.version}-{self.pruning.key}"
+            )
+        return cache_dir
+
+    def pruned(self, pruning: PruningConfig):
+        """
+        Returns a container for a pruned copy of this network (see PruningConfig). Pruned
+        variants are cached next to the full network, keyed by version and pruning
+        config, and rebuilt when the network has changed since. Edges can't be added to
+        a pruned container: add them to this one and call pruned again.
+        """
+        if self.pruning is not None:
+            raise ValueError("Network is already pruned.")
+        pruned_container = NetworkContainer(
+            self.network_edge_list.directed,
+            self.version,
+            network_edge_list=self.network_edge_list,
+            fingerprint=self.fingerprint,
+            compacted_delta=self.delta_edges,
+        )
+        pruned_container.pruning = pruning
+        if self.fingerprint is not None:
+            try:
+                header = NetworkEdgeList.read_header(pruned_container.cache_dir)
+                if header["compacted_delta"] == self.delta_edges:
+                    pruned_container.network_edge_list = NetworkEdgeList.load(
+                        pruned_container.cache_dir, self.version
+                    )
+                    return pruned_container
+            except (OSError, ValueError, KeyError):
+                pass
+        print("Pruning network.")
+        neighbor_scores = None
+        if pruning.rank_by == "followers_count":
+            neighbor_scores = self.followers_counts()
+        elif pruning.rank_by != "hub_degree":
+            raise ValueError(f"Unknown pruning rank: {pruning.rank_by}")
+        pruned_container.network_edge_list = self.network_edge_list.pruned(
+            pruning.max_hub_degree,
+            pruning.max_degree,
+            pruning.degree_exponent,
+            neighbor_scores,
+        )
+        if self.fingerprint is not None:
+            pruned_container.cache()
+        return pruned_container
+
+    def followers_counts(self) -> np.ndarray:
+        """Returns the followers_count of each node from the users file (0 if unknown)."""
+        graph = self.network_edge_list
+        users = load_users(["id", "followers_count"])
+        node_indices = graph.indices_of(users["id"].to_numpy())
+        in_graph = node_indices >= 0
+        followers_counts = np.zeros(graph.num_nodes)
+        followers_counts[node_indices[in_graph]] = (
+            users["followers_count"].fillna(0).to_numpy("float64")[in_graph]
+        )
+        return followers_counts
 
     def cache(self):
+        if self.fingerprint is None:
+            raise ValueError("Can't cache a network without an edge fingerprint.")
         print("Caching network.")
-        with open(NETWORK_CACHE_PATH.format(self.version), "wb") as cache_file:
-            pickle.dump(self, cache_file)
+        self._save(self.network_edge_list, self.delta_edges)
+
+    def _save(self, network_edge_list, delta_edges):
+        network_edge_list.save(
+            self.cache_dir,
+            fingerprint=self.fingerprint,
+            compacted_delta=delta_edges,
+        )
+        self.compacted_delta = delta_edges
+
+    def compact(self, background=True):
+        """
+        Folds the delta-log edges into the cached base arrays. In the background, the
+        current edge list is snapshotted and written by a (non-daemon) thread, so the
+        process still finishes the compaction before it exits.
+        """
+        if self.pruning is not None:
+            raise ValueError("Pruned networks are only cached by pruned.")
+        if self._compaction is not None and self._compaction.is_alive():
+            return self._compaction
+        args = (self.network_edge_list, self.delta_edges)
+        if not background:
+            self._save(*args)
+            return None
+        self._compaction = threading.Thread(target=self._save, args=args)
+        self._compaction.start()
+        return self._compaction
+
+    def maybe_compact(self, threshold=COMPACTION_THRESHOLD):
+        """Starts a background compaction once enough delta edges have piled up."""
+        if (
+            self.fingerprint is not None
+            and self.pruning is None
+            and self.delta_edges - self.compacted_delta >= threshold
+        ):
+            print("Compacting network cache in the background.")
+            return self.compact(background=True)
 
     @staticmethod
     def get_network(
@@ -76,46 +682,63 @@ class NetworkContainer:
         directed=True,
         version="following",
         edges=None,
-        rebuild_nel=False,
+        pruning: Optional[PruningConfig] = None,
     ):
+        """
+        Returns the network for the given edges (EDGE_CSV_PATH if omitted). Cached
+        networks are keyed by a fingerprint of the edges plus directed, so a cache is
+        only rebuilt when one of those actually changes. Both directions are cached
+        together, so "following" and "followers" share one cache. Edges appended since
+        the cache was written are replayed from the delta log.
 
+        :param pruning: (optional) return a pruned variant of the network instead (see
+            pruned)
+        """
+        if pruning is not None:
+            return NetworkContainer.get_network(
+                enable_caching, directed, version, edges
+            ).pruned(pruning)
         if not enable_caching:
             return NetworkContainer(directed, version, edges)
-        if os.path.exists(NETWORK_CACHE_PATH.format(version)):
+        if edges is None:
+            fingerprint = file_fingerprint(EDGE_CSV_PATH)
+        else:
+            fingerprint = frame_fingerprint(edges)
+        cache_dir = variant_dir(fingerprint, directed)
+        if os.path.exists(os.path.join(cache_dir, "header.json")):
             try:
-                with open(NETWORK_CACHE_PATH.format(version), "rb") as cache_file:
-                    print("Loading network from cache.")
-                    network_container = pickle.load(cache_file)
-                    if directed and not network_container.network.is_directed():
-                        network_container.network = (
-                            network_container.network.to_directed()
-                        )
-                    elif not directed and network_container.network.is_directed():
-                        network_container.network = (
-                            network_container.network.to_undirected()
-                        )
-                    # Rebuilding the NEL should be done only if it was originally
-                    # written as directed, and is then used for the recommender method
-                    if rebuild_nel:
-                        network_container.network_edge_list = NetworkEdgeList(
-                            edges, directed, version
-                        )
-                    return network_container
+                print("Loading network from cache.")
+                header = NetworkEdgeList.read_header(cache_dir)
+                if (header["fingerprint"], header["directed"]) != (
+                    fingerprint,
+                    directed,
+                ):
+                    raise ValueError("Cache header does not match its variant.")
+                network_container = NetworkContainer(
+                    directed,
+                    version,
+                    network_edge_list=NetworkEdgeList.load(cache_dir, version),
+                    fingerprint=fingerprint,
+                    compacted_delta=header["compacted_delta"],
+                )
+                network_container.apply_delta_log()
+                network_container.maybe_compact()
+                return network_container
             except BaseException as err:
                 print("Loading network from cache file failed with error:", err)
-                # Create a new network if fetching from cache fails
-                return NetworkContainer(directed, version, edges)
-        else:
-            # Otherwise, construct a new network and cache it.
-            new_network = NetworkContainer(directed, version, edges)
-            new_network.cache()
-            return new_network
+        # Otherwise, construct a new network and cache it.
+        new_network = NetworkContainer(
+            directed, version, edges, fingerprint=fingerprint
+        )
+        new_network.apply_delta_log()
+        new_network.cache()
+        return new_network
 
     @staticmethod
-    def construct_network(edges, directed=True, version="following"):
-        return nx.from_pandas_edgelist(
-            edges,
-            "follower" if version == "following" else "followed",
-            "followed" if version == "following" else "follower",
-            create_using=nx.DiGraph if directed else nx.Graph,
-        )
+    def construct_network(network_edge_list: NetworkEdgeList):
+        network = nx.DiGraph() if network_edge_list.directed else nx.Graph()
+        sources, targets = network_edge_list.edge_arrays()
+        if network_edge_list.default_direction == "in":
+            sources, targets = targets, sources
+        network.add_edges_from(zip(sources.tolist(), targets.tolist()))
+        return network
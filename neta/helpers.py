@@ -1,29 +1,52 @@
-import heapq
 from collections import OrderedDict
 from math import inf
-from typing import Dict
+from typing import Dict, NamedTuple, Union
 
+import numpy as np
 import pandas as pd
 
 
+class ScoreVector(NamedTuple):
+    """
+    Scores of many nodes as parallel arrays rather than a dictionary, e.g. one value per
+    node of a NetworkEdgeList (node_ids=graph.node_ids) or per visited node.
+    """
+
+    node_ids: np.ndarray
+    values: np.ndarray
+
+    def to_dict(self) -> Dict[int, float]:
+        return dict(zip(self.node_ids.tolist(), self.values.tolist()))
+
+
 class UserHelper:
     """On initialization, loads the users.csv data into memory.
     Provides various helper methods to look up and format data about users"""
 
     users: pd.DataFrame
 
-    def __init__(self, users=None):
+    def __init__(self, users=None, columns=None):
         """Initialize user helper.
 
         :param users: (optional) dataframe containing user data
+        :param columns: (optional) user columns to load when users is omitted (all of
+            them by default); "id" is always loaded
         """
-        from neta.constants import USERS_FILE_PATH
+        from neta.loaders import load_users
 
         if users is None:
-            users = pd.read_csv(USERS_FILE_PATH)
+            users = load_users(
+                ["id", *(column for column in columns if column != "id")]
+                if columns
+                else None
+            )
         self.users = users.set_index("id")
 
-    def users_with_values(self, user_value_dict: Dict[int, float]):
+    def users_with_values(self, user_value_dict: Union[Dict[int, float], ScoreVector]):
+        if isinstance(user_value_dict, ScoreVector):
+            users = self.users.reindex(user_value_dict.node_ids)
+            users["value"] = user_value_dict.values
+            return users
         users = self.users.reindex(user_value_dict)
         users["value"] = pd.Series(user_value_dict)
         return users
@@ -39,21 +62,44 @@ class UserHelper:
         else:
             return ids[0]
 
-    def pretty_print(self, user_value_dict: Dict[int, float]) -> str:
+    def get_ids(self, names) -> Dict[str, int]:
+        """get_id for many usernames with a single scan of the users. Usernames that
+        aren't found are left out."""
+        users = self.users[self.users.username.isin(set(names))]
+        ids = {}
+        for id, name in zip(users.index.tolist(), users.username.tolist()):
+            ids.setdefault(name, id)
+        for name in names:
+            if name not in ids:
+                print(f"ID of user {name} not found (probably not in network).")
+        return ids
+
+    def pretty_print(
+        self, user_value_dict: Union[Dict[int, float], ScoreVector]
+    ) -> str:
         users = self.users_with_values(user_value_dict)
         return users[["username", "value"]].to_string()
 
 
-def top_n(value_dict: dict, n: int) -> Dict[int, float]:
-
-    """Helper function to find the n highest-value keys in a dictionary.
-    Runs in O(n+k) time for a dictionary with k entries."""
+def top_n(
+    value_dict: Union[dict, ScoreVector], n: int
+) -> Union[Dict[int, float], ScoreVector]:
+    """Helper function to find the n highest-value keys in a dictionary or ScoreVector,
+    as a dictionary ordered by descending value. Runs in O(k + n log n) time for k
+    entries, and for a ScoreVector only the n winners are converted to Python objects.
+    Returns the input unchanged if n is None."""
     if n is None or n == inf:
         return value_dict
-    # Have to reformat the dict like this for heapq to cooperate.
-    collection = [(value, key) for key, value in value_dict.items()]
-    heapq.heapify(collection)
-    top_n_items = OrderedDict()
-    for nth_largest in heapq.nlargest(n, collection):
-        top_n_items[nth_largest[1]] = nth_largest[0]  # Reconstruct the dict
-    return top_n_items
+    if isinstance(value_dict, ScoreVector):
+        keys, values = value_dict.node_ids, np.asarray(value_dict.values)
+    else:
+        keys = list(value_dict)
+        values = np.fromiter(value_dict.values(), dtype="float64", count=len(keys))
+    n = min(n, len(values))
+    if n <= 0:
+        return OrderedDict()
+    winners = np.argpartition(-values, n - 1)[:n]
+    winners = winners[np.argsort(-values[winners], kind="stable")]
+    if isinstance(value_dict, ScoreVector):
+        return OrderedDict(zip(keys[winners].tolist(), values[winners].tolist()))
+    return OrderedDict((keys[i], value_dict[keys[i]]) for i in winners.tolist())
@@ -0,0 +1,200 @@
+"""
+Typed, columnar loading of the scraped edge and user CSVs. Each CSV is converted once
+into a store under COLUMNAR_DIR, which is reused until the CSV's size or modification
+time changes.
+"""
+
+import json
+import os
+from contextlib import suppress
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from neta.constants import COLUMNAR_DIR, EDGE_CSV_PATH, USERS_FILE_PATH
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+EDGE_COLUMNS = ("follower", "followed")
+# Rows parsed per chunk when streaming the edge CSV, which bounds peak memory
+EDGE_CHUNK_SIZE = 5000000
+
+USER_DTYPES = {
+    "id": "int64",
+    "username": "string",
+    "created_at": "string",
+    "name": "string",
+    "location": "category",
+    "description": "string",
+    "verified": "boolean",
+    "followers_count": "Int64",
+    "following_count": "Int64",
+    "listed_count": "Int64",
+    "tweet_count": "Int64",
+}
+
+
+def iter_edge_chunks(
+    path=EDGE_CSV_PATH, columns: Sequence[str] = EDGE_COLUMNS, chunksize=EDGE_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Streams the edge CSV in chunks of at most chunksize rows of int64 columns."""
+    yield from pd.read_csv(
+        path,
+        usecols=list(columns),
+        dtype={column: "int64" for column in columns},
+        chunksize=chunksize,
+    )
+
+
+def edge_columns(
+    columns: Sequence[str] = EDGE_COLUMNS, path=EDGE_CSV_PATH, mmap_mode="r"
+) -> Dict[str, np.ndarray]:
+    """
+    Returns the requested edge columns as (memory-mapped) int64 arrays, converting the
+    CSV to the columnar store first if it is missing or stale.
+    """
+    store_dir = _store_dir(path)
+    if not _is_fresh(store_dir, path):
+        convert_edges(path, store_dir)
+    return {
+        column: np.load(os.path.join(store_dir, f"{column}.npy"), mmap_mode=mmap_mode)
+        for column in columns
+    }
+
+
+def load_edges(
+    columns: Sequence[str] = EDGE_COLUMNS, path=EDGE_CSV_PATH
+) -> pd.DataFrame:
+    """Returns the requested edge columns as an int64 dataframe."""
+    return pd.DataFrame(edge_columns(columns, path))
+
+
+def convert_edges(path=EDGE_CSV_PATH, store_dir=None, chunksize=EDGE_CHUNK_SIZE):
+    """
+    Converts the edge CSV into one int64 .npy file per column. The CSV is streamed in
+    chunks straight into preallocated memory-mapped arrays, so files far larger than
+    memory can be converted.
+    """
+    store_dir = store_dir or _store_dir(path)
+    os.makedirs(store_dir, exist_ok=True)
+    stat = os.stat(path)
+    num_rows = _count_rows(path)
+    arrays = {
+        column: np.lib.format.open_memmap(
+            os.path.join(store_dir, f"{column}.npy.{os.getpid()}.tmp"),
+            mode="w+",
+            dtype="int64",
+            shape=(num_rows,),
+        )
+        for column in EDGE_COLUMNS
+    }
+    filled = 0
+    for chunk in iter_edge_chunks(path, EDGE_COLUMNS, chunksize):
+        for column in EDGE_COLUMNS:
+            arrays[column][filled : filled + len(chunk)] = chunk[column].to_numpy()
+        filled += len(chunk)
+    for column, array in arrays.items():
+        array_path = os.path.join(store_dir, f"{column}.npy")
+        tmp_path = f"{array_path}.{os.getpid()}.tmp"
+        array.flush()
+        if filled != num_rows:
+            # Blank lines are counted as rows but skipped by the parser
+            np.save(tmp_path + ".npy", array[:filled])
+            os.replace(tmp_path + ".npy", array_path)
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, array_path)
+    del arrays
+    _write_meta(store_dir, stat, filled)
+
+
+def load_users(
+    columns: Optional[Sequence[str]] = None, path=USERS_FILE_PATH
+) -> pd.DataFrame:
+    """
+    Returns the requested user columns (all of them if columns is None) with the types
+    in USER_DTYPES. The CSV is converted once to Parquet, from which only the requested
+    columns are read back, or to a pickle of the typed dataframe if pyarrow isn't
+    installed.
+    """
+    store_dir = _store_dir(path)
+    store_path = os.path.join(
+        store_dir, "users.parquet" if HAS_PYARROW else "users.pkl"
+    )
+    if not (_is_fresh(store_dir, path) and os.path.isfile(store_path)):
+        os.makedirs(store_dir, exist_ok=True)
+        stat = os.stat(path)
+        users = _read_users_csv(path)
+        tmp_path = f"{store_path}.{os.getpid()}.tmp"
+        if HAS_PYARROW:
+            users.to_parquet(tmp_path, index=False)
+        else:
+            users.to_pickle(tmp_path)
+        # Drop the other format's file, which may be from an older CSV
+        for store_name in ("users.parquet", "users.pkl"):
+            other_path = os.path.join(store_dir, store_name)
+            if other_path != store_path:
+                with suppress(FileNotFoundError):
+                    os.remove(other_path)
+        os.replace(tmp_path, store_path)
+        _write_meta(store_dir, stat, len(users))
+    if HAS_PYARROW:
+        return pd.read_parquet(store_path, columns=list(columns) if columns else None)
+    users = pd.read_pickle(store_path)
+    return users[list(columns)] if columns else users
+
+
+def _read_users_csv(path, columns=None) -> pd.DataFrame:
+    return pd.read_csv(
+        path,
+        usecols=list(columns) if columns else None,
+        dtype=USER_DTYPES,
+    )
+
+
+def _store_dir(path) -> str:
+    return os.path.join(COLUMNAR_DIR, Path(path).stem)
+
+
+def _is_fresh(store_dir, path) -> bool:
+    try:
+        with open(os.path.join(store_dir, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return False
+    stat = os.stat(path)
+    return (meta["source_size"], meta["source_mtime_ns"]) == (
+        stat.st_size,
+        stat.st_mtime_ns,
+    )
+
+
+def _write_meta(store_dir, stat, num_rows):
+    with open(os.path.join(store_dir, "meta.json"), "w") as meta_file:
+        json.dump(
+            {
+                "source_size": stat.st_size,
+                "source_mtime_ns": stat.st_mtime_ns,
+                "num_rows": num_rows,
+            },
+            meta_file,
+        )
+
+
+def _count_rows(path) -> int:
+    """Counts data rows (lines after the header) without parsing the file."""
+    num_lines, last_block = 0, b""
+    with open(path, "rb") as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 24), b""):
+            num_lines += block.count(b"\n")
+            last_block = block
+    if last_block and not last_block.endswith(b"\n"):
+        num_lines += 1
+    return max(num_lines - 1, 0)
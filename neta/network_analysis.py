@@ -1,9 +1,13 @@
-from typing import Dict, Set
+import weakref
+from typing import Dict, Set, Tuple, Union
 
 import networkx as nx
+import numpy as np
+from scipy import sparse
 
-from neta.graph import NetworkContainer
-from neta.helpers import UserHelper, top_n
+from neta.centrality import eigenvector_centrality
+from neta.graph import NetworkContainer, NetworkEdgeList, build_csr
+from neta.helpers import ScoreVector, UserHelper, top_n
 from neta.recommendations import Recommendation
 
 GWWC_NODES = frozenset({
@@ -24,22 +28,73 @@ GWWC_NODES = frozenset({
 })
 
 
-def centrality(network) -> Dict[int, float]:
+# Normalized GWWC alignments by edge list (see normalized_gwwc_alignment)
+_gwwc_alignment_cache = weakref.WeakKeyDictionary()
+
+
+def centrality(network) -> Union[Dict[int, float], ScoreVector]:
+    """Eigenvector centrality. For a NetworkContainer or NetworkEdgeList, it is computed
+    on the CSR arrays (see neta.centrality) rather than with networkx."""
+    if isinstance(network, (NetworkContainer, NetworkEdgeList)):
+        return eigenvector_centrality(network)
     return nx.eigenvector_centrality_numpy(network)
 
 
-def out_neighbors(network, node: int) -> Set[int]:
+def out_neighbors(network, node: int, direction=None) -> Set[int]:
+    """Neighbors of node in a networkx graph or a NetworkEdgeList. For an edge list, the
+    direction ("out" or "in") defaults to the one matching its version."""
+    if isinstance(network, NetworkEdgeList):
+        return set(network.neighbors(node, direction).tolist())
+    if direction == "in":
+        return {edge[0] for edge in network.in_edges(node)}
     return {edge[1] for edge in network.edges(node)}
 
 
+def adjacency_matrix(network, direction=None) -> Tuple[np.ndarray, sparse.csr_matrix]:
+    """
+    Returns the node IDs and sparse adjacency matrix of a NetworkContainer,
+    NetworkEdgeList or networkx graph, where row i holds the out neighbors of node_ids[i]
+    (as in out_neighbors). Nodes of a networkx graph without edges are left out.
+    """
+    if isinstance(network, NetworkContainer):
+        network = network.network_edge_list
+    if isinstance(network, NetworkEdgeList):
+        indptr, indices = network.adjacency(direction)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype="int32"), indices, indptr),
+            shape=(network.num_nodes, network.num_nodes),
+        )
+        return network.node_ids, matrix
+    edges = np.array(list(network.edges), dtype="int64").reshape(-1, 2)
+    sources, targets = edges[:, 0], edges[:, 1]
+    if direction == "in":
+        sources, targets = targets, sources
+    return adjacency_matrix(
+        NetworkEdgeList.from_arrays(
+            *build_csr(sources, targets, network.is_directed()),
+            directed=network.is_directed(),
+        )
+    )
+
+
 def get_gwwc_out_neighbors(network, aggregated=False):
     """
     When aggregated=False, a list of sets containing each GWWC node's out neighbors is returned. When aggregated=True,
-    those sets are unioned and returned as a single set.
+    those sets are unioned and returned as a single set. The sets are read off the rows of adjacency_matrix.
+    :param network: A NetworkContainer, NetworkEdgeList or networkx graph
     :param aggregated: Determines whether the function returns a list of Set[int] or a single, aggregated Set[int]
     :return: Either a disaggregated List[Set[int]] or an aggregated Set[int].
     """
-    gwwc_followed_sets = [out_neighbors(network, node) for node in GWWC_NODES]
+    node_ids, adjacency = adjacency_matrix(network)
+    gwwc_ids = np.fromiter(GWWC_NODES, dtype="int64")
+    gwwc_indices = np.minimum(
+        np.searchsorted(node_ids, gwwc_ids), max(len(node_ids) - 1, 0)
+    )
+    in_network = node_ids[gwwc_indices] == gwwc_ids
+    gwwc_followed_sets = [
+        set(node_ids[adjacency[index].indices].tolist()) if is_in_network else set()
+        for index, is_in_network in zip(gwwc_indices.tolist(), in_network.tolist())
+    ]
     if aggregated:
         return set().union(*gwwc_followed_sets)
     return gwwc_followed_sets
@@ -64,45 +119,108 @@ def get_nodes(
     return filtered_nodes
 
 
-def node_alignment(network, node_id: int) -> Dict[int, float]:
-    alignment_values = {}
-    given_node_neighbors = out_neighbors(network, node_id)
-    for other_node in get_nodes(network, nonzero_out_neighbors=True):
-        if other_node != node_id:
-            try:
-                alignment_values[other_node] = jaccard_index(
-                    out_neighbors(network, other_node), given_node_neighbors
-                )
-            except:
-                print("failure")
-    return alignment_values
-
-
-def gwwc_alignment_fast(network) -> Dict[int, float]:
-    """Jaccard similarity between union of GWWC nodes' follows and the given node's follows"""
-    gwwc_followed_set = get_gwwc_out_neighbors(network, aggregated=True)
-    alignment_values = {}
-    for node in get_nodes(
-        network, nonzero_out_neighbors=True, exclude_gwwc_accounts=True
-    ):
-        node_out_edges = out_neighbors(network, node)
-        alignment_values[node] = jaccard_index(node_out_edges, gwwc_followed_set)
-    return alignment_values
-
-
-def gwwc_alignment_disaggregated(network) -> Dict[int, float]:
-    """Average of Jaccard similarity for each GWWC account's follows and the given node's follows"""
-    gwwc_followed_sets = get_gwwc_out_neighbors(network, aggregated=False)
-    alignment_values = {}
-    for node in get_nodes(
-        network, nonzero_out_neighbors=True, exclude_gwwc_accounts=True
-    ):
-        node_out_edges = out_neighbors(network, node)
-        alignment_values[node] = sum(
-            jaccard_index(node_out_edges, followed_set)
-            for followed_set in gwwc_followed_sets
-        ) / len(gwwc_followed_sets)
-    return alignment_values
+def node_alignment(
+    network, node_id: int, similarity_index=None, exact=False
+) -> ScoreVector:
+    """
+    Jaccard similarity between the given node's follows and every other node's follows,
+    for every other node with follows. Computed for all nodes at once, as a single
+    column of seed_jaccard_matrix.
+
+    :param network: A NetworkContainer, NetworkEdgeList or networkx graph
+    :param similarity_index: (optional) a MinHashIndex of the network, to only score the
+        node's LSH candidates (estimated, or exactly if exact is True) instead of all
+        nodes
+    """
+    if similarity_index is not None:
+        return similarity_index.alignment(node_id, exact)
+    node_ids, adjacency = adjacency_matrix(network)
+    jaccards = _seed_jaccards(node_ids, adjacency, [node_id]).tocsc()
+    alignments = np.zeros(len(node_ids))
+    alignments[jaccards.indices] = jaccards.data
+    candidates = np.flatnonzero((np.diff(adjacency.indptr) > 0) & (node_ids != node_id))
+    return ScoreVector(node_ids[candidates], alignments[candidates])
+
+
+def gwwc_alignment_fast(network) -> ScoreVector:
+    """
+    Jaccard similarity between union of GWWC nodes' follows and the given node's follows,
+    for every node with follows (except the GWWC nodes). Computed for all nodes at once:
+    intersection sizes are the adjacency matrix times the indicator vector of the GWWC
+    union, and union sizes follow from the out degrees.
+
+    :param network: A NetworkContainer, NetworkEdgeList or networkx graph
+    """
+    node_ids, adjacency = adjacency_matrix(network)
+    is_gwwc = np.isin(node_ids, list(GWWC_NODES))
+    gwwc_followed = np.zeros(len(node_ids), dtype="int32")
+    gwwc_followed[adjacency[is_gwwc].indices] = 1
+    intersections = adjacency @ gwwc_followed
+    out_degrees = np.diff(adjacency.indptr)
+    candidates = np.flatnonzero((out_degrees > 0) & ~is_gwwc)
+    unions = out_degrees[candidates] + gwwc_followed.sum() - intersections[candidates]
+    return ScoreVector(node_ids[candidates], intersections[candidates] / unions)
+
+
+def gwwc_alignment_disaggregated(network, seed_ids=GWWC_NODES) -> ScoreVector:
+    """
+    Average of Jaccard similarity for each GWWC account's follows and the given node's
+    follows, for every node with follows (except the seeds). See seed_jaccard_matrix.
+
+    :param network: A NetworkContainer, NetworkEdgeList or networkx graph
+    :param seed_ids: (optional) seed accounts to average over instead of GWWC_NODES
+    """
+    node_ids, adjacency = adjacency_matrix(network)
+    # Sum each row in seed order (CSC order), as summing the seeds one by one would
+    jaccards = _seed_jaccards(node_ids, adjacency, seed_ids).tocsc()
+    alignments = np.bincount(
+        jaccards.indices, weights=jaccards.data, minlength=len(node_ids)
+    ) / len(seed_ids)
+    candidates = np.flatnonzero(
+        (np.diff(adjacency.indptr) > 0) & ~np.isin(node_ids, list(seed_ids))
+    )
+    return ScoreVector(node_ids[candidates], alignments[candidates])
+
+
+def seed_jaccard_matrix(network, seed_ids) -> Tuple[np.ndarray, sparse.csr_matrix]:
+    """
+    Jaccard similarity between each node's follows and each seed's follows, for all
+    nodes and seeds at once. Intersection sizes are the sparse product of the adjacency
+    matrix with the nodes x seeds indicator matrix of the seeds' follows, and union
+    sizes follow from the out degrees.
+
+    :param seed_ids: Iterable of seed IDs (seeds not in the network follow nobody)
+    :return: The node IDs, and a sparse node x seed matrix of Jaccard similarities with
+        the seeds in the iteration order of seed_ids (zero entries are not stored)
+    """
+    node_ids, adjacency = adjacency_matrix(network)
+    return node_ids, _seed_jaccards(node_ids, adjacency, seed_ids)
+
+
+def _seed_jaccards(node_ids, adjacency, seed_ids) -> sparse.csr_matrix:
+    seed_ids = np.fromiter(seed_ids, dtype="int64")
+    seed_indices = np.minimum(
+        np.searchsorted(node_ids, seed_ids), max(len(node_ids) - 1, 0)
+    )
+    in_network = node_ids[seed_indices] == seed_ids
+    seed_selection = sparse.csr_matrix(
+        (
+            np.ones(np.count_nonzero(in_network), dtype="int32"),
+            (np.flatnonzero(in_network), seed_indices[in_network]),
+        ),
+        shape=(len(seed_ids), len(node_ids)),
+    )
+    seed_followed = (seed_selection @ adjacency).tocsr()
+    intersections = (adjacency @ seed_followed.T).tocoo()
+    unions = (
+        np.diff(adjacency.indptr)[intersections.row]
+        + np.diff(seed_followed.indptr)[intersections.col]
+        - intersections.data
+    )
+    return sparse.csr_matrix(
+        (intersections.data / unions, (intersections.row, intersections.col)),
+        shape=intersections.shape,
+    )
 
 
 def normalize_dict(value_dict: Dict[int, float]) -> Dict[int, float]:
@@ -110,14 +228,89 @@ def normalize_dict(value_dict: Dict[int, float]) -> Dict[int, float]:
     return {key: val * factor for key, val in value_dict.items()}
 
 
-def connector_nodes(network, other_node: int) -> Dict[int, float]:
-    gwwc_alignments = normalize_dict(gwwc_alignment_fast(network))
-    other_node_alignments = normalize_dict(node_alignment(network, other_node))
-    overlapping_keys = set(gwwc_alignments.keys()) & set(other_node_alignments.keys())
-    alignment_sums = {}
-    for key in overlapping_keys:
-        alignment_sums[key] = gwwc_alignments[key] + other_node_alignments[key]
-    return alignment_sums
+def normalized_gwwc_alignment(network) -> ScoreVector:
+    """
+    gwwc_alignment_fast normalized to sum to 1. It only depends on the graph, so for a
+    NetworkContainer or NetworkEdgeList it is computed once per version of the edge list
+    (adding edges to a container swaps in a new edge list).
+    """
+    if isinstance(network, NetworkContainer):
+        network = network.network_edge_list
+    if isinstance(network, NetworkEdgeList) and network in _gwwc_alignment_cache:
+        return _gwwc_alignment_cache[network]
+    alignments = gwwc_alignment_fast(network)
+    normalized = ScoreVector(
+        alignments.node_ids, alignments.values / alignments.values.sum()
+    )
+    if isinstance(network, NetworkEdgeList):
+        _gwwc_alignment_cache[network] = normalized
+    return normalized
+
+
+def connector_nodes(
+    network, other_node: int, similarity_index=None
+) -> Dict[int, float]:
+    """
+    :param similarity_index: (optional) a MinHashIndex of the network, to only consider
+        the other node's LSH candidates (see node_alignment)
+    """
+    return connector_nodes_batch(network, [other_node], similarity_index)[
+        other_node
+    ].to_dict()
+
+
+def connector_nodes_batch(
+    network, other_nodes, similarity_index=None, gwwc_alignments=None
+) -> Dict[int, ScoreVector]:
+    """
+    connector_nodes for many other nodes at once: the sum of each node's normalized GWWC
+    alignment and its normalized alignment with the other node. The GWWC half is shared
+    by all other nodes, and their alignments are computed together as one sparse
+    product (see seed_jaccard_matrix).
+
+    :param network: A NetworkContainer, NetworkEdgeList or networkx graph
+    :param other_nodes: Iterable of node IDs to find connectors for
+    :param similarity_index: (optional) a MinHashIndex of the network, to only consider
+        each other node's LSH candidates (see node_alignment)
+    :param gwwc_alignments: (optional) normalized_gwwc_alignment of the network, if
+        already computed
+    :return: The connector scores for each other node
+    """
+    node_ids, adjacency = adjacency_matrix(network)
+    other_nodes = list(other_nodes)
+    if gwwc_alignments is None:
+        gwwc_alignments = normalized_gwwc_alignment(network)
+    gwwc_indices = np.searchsorted(node_ids, gwwc_alignments.node_ids)
+    gwwc_values = np.zeros(len(node_ids))
+    gwwc_values[gwwc_indices] = gwwc_alignments.values
+    has_gwwc_value = np.zeros(len(node_ids), dtype=bool)
+    has_gwwc_value[gwwc_indices] = True
+    has_neighbors = np.diff(adjacency.indptr) > 0
+    if similarity_index is None:
+        jaccards = _seed_jaccards(node_ids, adjacency, other_nodes).tocsc()
+
+    connectors = {}
+    for column, other_node in enumerate(other_nodes):
+        alignments = np.zeros(len(node_ids))
+        if similarity_index is None:
+            start, end = jaccards.indptr[column], jaccards.indptr[column + 1]
+            alignments[jaccards.indices[start:end]] = jaccards.data[start:end]
+            # node_alignment scores every other node with follows
+            is_scored = has_neighbors.copy()
+            is_scored[node_ids == other_node] = False
+        else:
+            candidates = similarity_index.alignment(other_node)
+            candidate_indices = np.searchsorted(node_ids, candidates.node_ids)
+            alignments[candidate_indices] = candidates.values
+            is_scored = np.zeros(len(node_ids), dtype=bool)
+            is_scored[candidate_indices] = True
+        total = alignments[is_scored].sum()
+        overlap = np.flatnonzero(is_scored & has_gwwc_value)
+        connectors[other_node] = ScoreVector(
+            node_ids[overlap],
+            gwwc_values[overlap] + (alignments[overlap] / total if total else 0),
+        )
+    return connectors
 
 
 if __name__ == "__main__":
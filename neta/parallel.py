@@ -0,0 +1,76 @@
+import os
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict
+
+import numpy as np
+
+# Shared memory blocks attached by this process, kept alive for as long as the arrays
+# viewing them are in use
+_attached_blocks = []
+
+
+class SharedArrays:
+    """
+    Context manager that exposes NumPy arrays to worker processes without giving each
+    worker its own copy. Arrays memory-mapped from a cache file are shared by path (the
+    workers map the same file, so they share the OS page cache). Any other array is
+    copied once into a shared memory block, which is released on exit.
+
+    Entering the context returns a picklable handle to pass to attach_arrays in the
+    workers.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.handle = {}
+        self._blocks = []
+        for name, array in arrays.items():
+            if _is_file_backed(array):
+                self.handle[name] = (
+                    "file",
+                    array.filename,
+                    array.offset,
+                    array.dtype.str,
+                    array.shape,
+                )
+                continue
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self.handle[name] = ("shm", block.name, 0, array.dtype.str, array.shape)
+
+    def __enter__(self):
+        return self.handle
+
+    def __exit__(self, *exc_info):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def attach_arrays(handle) -> Dict[str, np.ndarray]:
+    """Returns read-only views of the arrays described by a SharedArrays handle."""
+    arrays = {}
+    for name, (kind, location, offset, dtype, shape) in handle.items():
+        if kind == "file":
+            arrays[name] = np.memmap(
+                location, dtype=dtype, mode="r", offset=offset, shape=shape
+            )
+            continue
+        block = SharedMemory(name=location)
+        _attached_blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+    return arrays
+
+
+def _is_file_backed(array) -> bool:
+    """Whether array is a whole memory-mapped .npy payload that can be mapped again by
+    path (and not, e.g., a slice of one)."""
+    return (
+        isinstance(array, np.memmap)
+        and array.filename is not None
+        and array.flags.c_contiguous
+        and os.path.getsize(array.filename) == array.offset + array.nbytes
+    )
@@ -1,5 +1,7 @@
 from random import randrange
 
+import numpy as np
+
 from neta.graph import NetworkContainer
 
 
@@ -18,17 +20,61 @@ class RandomWalker:
         :return: The destination node's identifier
         """
         walk_length = randrange(0, max_walk_length) + 1
-        curr_node = source_node
+        graph = self.citation_network.network_edge_list
+        curr_index = graph.index_of(source_node)
+        if curr_index < 0:
+            return source_node, walk_length
         for step in range(walk_length):
-            curr_node = self.random_neighbor_fast(curr_node)
-        return curr_node, walk_length
-
-    def random_neighbor_fast(self, source_node):
-        if source_node not in self.citation_network.network_edge_list.node_metadata:
-            return source_node
-        node_info = self.citation_network.network_edge_list.node_metadata[source_node]
-        if node_info.start == node_info.end:
-            return source_node
-        return self.citation_network.network_edge_list.edge_list[
-            randrange(node_info.start, node_info.end)
-        ]
+            curr_index = self.random_neighbor_fast(curr_index)
+        return int(graph.node_ids[curr_index]), walk_length
+
+    def random_neighbor_fast(self, source_index, direction=None):
+        """Returns the index of a random neighbor of the node at source_index (or
+        source_index itself if the node has no neighbors). The direction ("out" or
+        "in") defaults to the one matching the network's version."""
+        indptr, indices = self.citation_network.network_edge_list.adjacency(direction)
+        start, end = indptr[source_index], indptr[source_index + 1]
+        if start == end:
+            return source_index
+        return indices[randrange(start, end)]
+
+    def random_walks(
+        self, source_index, num_walks, max_walk_length, rng, direction=None
+    ):
+        """
+        Performs num_walks random walks from the node at source_index at once (see
+        batched_random_walks), in the given direction.
+        """
+        indptr, indices = self.citation_network.network_edge_list.adjacency(direction)
+        return batched_random_walks(
+            indptr, indices, source_index, num_walks, max_walk_length, rng
+        )
+
+
+def batched_random_walks(
+    indptr, indices, source_index, num_walks, max_walk_length, rng
+):
+    """
+    Performs num_walks random walks from the node at source_index at once, advancing
+    all walkers in lockstep with vectorized neighbor sampling over the CSR arrays. As
+    in RandomWalker.random_walk, each walk's length is uniform in [1, max_walk_length]
+    and walkers stay in place at nodes without neighbors.
+
+    :param indptr: CSR offsets of the adjacency to walk on
+    :param indices: CSR neighbor indices of the adjacency to walk on
+    :param source_index: The source node's index
+    :param num_walks: The number of walks to perform
+    :param max_walk_length: The maximum number of steps of a single walk
+    :param rng: The np.random.Generator to sample walk lengths and neighbors with
+    :return: Arrays of the walks' destination node indices and walk lengths
+    """
+    walk_lengths = rng.integers(1, max_walk_length + 1, size=num_walks)
+    curr_indices = np.full(num_walks, source_index, dtype="int64")
+    for step in range(max_walk_length):
+        walking = np.flatnonzero(walk_lengths > step)
+        starts = indptr[curr_indices[walking]]
+        degrees = indptr[curr_indices[walking] + 1] - starts
+        moving = degrees > 0
+        offsets = rng.integers(0, degrees[moving])
+        curr_indices[walking[moving]] = indices[starts[moving] + offsets]
+    return curr_indices, walk_lengths
@@ -0,0 +1,203 @@
+"""
+Token-bucket rate limiting for the Twitter API, one bucket per endpoint (and per
+credential, see CredentialPool), kept in sync with the x-rate-limit-* headers of the
+responses. The clock and sleep functions can be swapped for fake ones, so the limiter
+can be run without waiting.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Documented requests per 15-minute window of each endpoint
+RATE_LIMIT_WINDOW = 15 * 60
+RATE_LIMITS = {
+    "follows": (15, RATE_LIMIT_WINDOW),
+    "lookup": (300, RATE_LIMIT_WINDOW),
+}
+
+
+class TokenBucket:
+    """
+    Allows up to capacity requests at once, refilled at capacity requests per window.
+    When a response reports that no requests are left (or the request was rate
+    limited), requests are held back until the window resets, after which the bucket
+    is full again, or until a later response reports requests left.
+    """
+
+    def __init__(self, capacity, window, clock=time.time):
+        """
+        :param capacity: Number of requests allowed per window
+        :param window: Length of the window in seconds
+        :param clock: Function returning the current time in seconds since the epoch
+            (like the x-rate-limit-reset header)
+        """
+        self.capacity = capacity
+        self.window = window
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        # When the exhausted window resets (None while requests are left)
+        self.reset_at = None
+
+    def _refill(self):
+        now = self.clock()
+        if self.reset_at is not None and now >= self.reset_at:
+            self.tokens = float(self.capacity)
+            self.reset_at = None
+        else:
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.capacity / self.window,
+            )
+        self.updated = now
+
+    def delay(self) -> float:
+        """Returns the number of seconds until a request is allowed."""
+        self._refill()
+        if self.reset_at is not None:
+            return self.reset_at - self.updated
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.window / self.capacity
+
+    async def acquire(self, sleep=asyncio.sleep):
+        """Waits until a request is allowed and takes a token for it."""
+        wait = self.delay()
+        while wait > 0:
+            await sleep(wait)
+            wait = self.delay()
+        self.tokens -= 1
+
+    def try_acquire(self) -> bool:
+        """Takes a token if a request is allowed right now."""
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def update(self, headers, rate_limited=False):
+        """
+        Syncs the bucket with the x-rate-limit-limit, -remaining and -reset headers of a
+        response (missing headers are ignored).
+
+        :param rate_limited: Whether the response was a 429, in which case no requests
+            are allowed until the reset even if the headers are missing
+        """
+        self._refill()
+        if "x-rate-limit-limit" in headers:
+            self.capacity = int(headers["x-rate-limit-limit"])
+        remaining = headers.get("x-rate-limit-remaining")
+        if remaining is not None:
+            if self.reset_at is not None and int(remaining) > 0 and not rate_limited:
+                # The window has reset already, as requests are left
+                self.tokens = float(self.capacity)
+                self.reset_at = None
+            self.tokens = min(self.tokens, int(remaining))
+        if rate_limited or (remaining is not None and int(remaining) == 0):
+            self.tokens = 0.0
+            reset = headers.get("x-rate-limit-reset")
+            self.reset_at = (
+                float(reset) if reset is not None else self.updated + self.window
+            )
+
+
+class RateLimiter:
+    """One TokenBucket per endpoint, sharing a clock and sleep function."""
+
+    buckets: Dict[str, TokenBucket]
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[int, float]] = None,
+        clock=time.time,
+        sleep=asyncio.sleep,
+    ):
+        """
+        :param limits: (optional) (requests, window in seconds) of each endpoint,
+            RATE_LIMITS by default
+        :param clock: Function returning the current time in seconds since the epoch
+        :param sleep: Coroutine function sleeping for the given number of seconds
+        """
+        self.buckets = {
+            endpoint: TokenBucket(capacity, window, clock)
+            for endpoint, (capacity, window) in (limits or RATE_LIMITS).items()
+        }
+        self.sleep = sleep
+
+    def delay(self, endpoint) -> float:
+        return self.buckets[endpoint].delay()
+
+    async def acquire(self, endpoint):
+        await self.buckets[endpoint].acquire(self.sleep)
+
+    def update(self, endpoint, headers, rate_limited=False):
+        self.buckets[endpoint].update(headers, rate_limited)
+
+
+class CredentialPool:
+    """
+    Bearer tokens of several developer apps, each with its own RateLimiter. Each request
+    goes to the credential whose quota for the endpoint frees up soonest, so a
+    rate-limited credential is skipped while the others are used, and the throughput
+    grows with the number of credentials.
+    """
+
+    limiters: List[RateLimiter]
+
+    def __init__(
+        self,
+        bearer_tokens: List[str],
+        limits: Dict[str, Tuple[int, float]] = None,
+        clock=time.time,
+        sleep=asyncio.sleep,
+    ):
+        """
+        :param bearer_tokens: One bearer token per credential
+        :param limits: (optional) (requests, window in seconds) of each endpoint, per
+            credential (RATE_LIMITS by default)
+        """
+        if not bearer_tokens:
+            raise ValueError("At least one bearer token is needed.")
+        self.bearer_tokens = list(bearer_tokens)
+        self.limiters = [RateLimiter(limits, clock, sleep) for _ in bearer_tokens]
+        self.sleep = sleep
+
+    def headers(self, credential: int) -> Dict[str, str]:
+        return {"Authorization": "Bearer {}".format(self.bearer_tokens[credential])}
+
+    def delay(self, endpoint) -> float:
+        """Returns the number of seconds until any credential allows a request."""
+        return min(limiter.delay(endpoint) for limiter in self.limiters)
+
+    def try_acquire(self, endpoint) -> Tuple[Optional[int], float]:
+        """
+        Takes a token from the credential whose quota frees up soonest if it allows a
+        request right now. Returns the credential's index (None if no token was taken)
+        and the number of seconds until it allows a request.
+        """
+        delays = [limiter.delay(endpoint) for limiter in self.limiters]
+        credential = min(range(len(delays)), key=delays.__getitem__)
+        if self.limiters[credential].buckets[endpoint].try_acquire():
+            return credential, 0.0
+        return None, delays[credential]
+
+    async def acquire(self, endpoint) -> int:
+        """Waits until a credential allows a request, takes a token from it and returns
+        its index."""
+        while True:
+            credential, wait = self.try_acquire(endpoint)
+            if credential is not None:
+                return credential
+            await self.sleep(wait)
+
+    def acquire_blocking(self, endpoint, sleep=time.sleep) -> int:
+        """acquire for synchronous callers, blocking the thread while waiting."""
+        while True:
+            credential, wait = self.try_acquire(endpoint)
+            if credential is not None:
+                return credential
+            sleep(wait)
+
+    def update(self, credential: int, endpoint, headers, rate_limited=False):
+        self.limiters[credential].update(endpoint, headers, rate_limited)
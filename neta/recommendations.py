@@ -1,21 +1,58 @@
 from math import log, sqrt
-from typing import Dict
+from multiprocessing import Pool
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
 
 from neta.graph import NetworkContainer
-from neta.helpers import top_n
-from neta.random_walker import RandomWalker
+from neta.helpers import ScoreVector, top_n
+from neta.parallel import SharedArrays, attach_arrays
+from neta.random_walker import RandomWalker, batched_random_walks
+from neta.visit_cache import VisitCountCache
 
 MAX_NUM_STEPS = 1000000
 MAX_WALK_LENGTH = 5
+# Number of walkers advanced at once by the vectorized walk engine
+WALK_BATCH_SIZE = 10000
+# Step budget of one independently seeded task in parallel mode
+PARALLEL_CHUNK_STEPS = 100000
+# Pixie's early-stopping parameters (n_p, n_v): stop walking from a seed once n_p
+# candidates have each been visited at least n_v times
+PIXIE_EARLY_STOPPING = (2000, 4)
+# Size of the ranking whose stability is reported in ConvergenceStats
+CONVERGENCE_TOP_K = 50
+# When tracking convergence, batches are shrunk so that the step budget is spread over
+# about this many of them, and the top-k stability reflects the last part of the walks
+CONVERGENCE_NUM_BATCHES = 20
+
+
+class ConvergenceStats(NamedTuple):
+    # Random-walk steps and counted walks used
+    num_steps: int
+    num_walks: int
+    # Whether the early-stopping criterion was met before the step budget ran out
+    early_stopped: bool
+    # Share of the top CONVERGENCE_TOP_K nodes after the last batch of walks that were
+    # already in the top CONVERGENCE_TOP_K one batch earlier (None after one batch)
+    top_k_stability: Optional[float]
 
 
 class Recommendation:
     network_container: NetworkContainer
     random_walker: RandomWalker
+    rng: np.random.Generator
+    # Convergence of the walks from each seed in the last recommendations call
+    convergence_stats: Dict[int, ConvergenceStats]
 
-    def __init__(self, citation_network: NetworkContainer):
+    def __init__(self, citation_network: NetworkContainer, seed=None):
+        """
+        :param citation_network: The network to walk on
+        :param seed: (optional) seed for the random walks, for reproducible results
+        """
         self.network_container = citation_network
         self.random_walker = RandomWalker(self.network_container)
+        self.rng = np.random.default_rng(seed)
+        self.convergence_stats = {}
 
     def recommendations(
         self,
@@ -23,61 +60,275 @@ class Recommendation:
         num_recommendations,
         max_walk_length=MAX_WALK_LENGTH,
         max_num_steps=MAX_NUM_STEPS,
+        num_processes=None,
+        early_stopping: Optional[Tuple[int, int]] = None,
+        use_visit_cache=False,
     ) -> Dict[int, float]:
+        """
+        Recommendations for a set of seed nodes: each seed gets a share of the step
+        budget based on its degree, and visit counts are summed over seeds.
+
+        :param num_processes: If given, each seed's step budget is split into
+            independently seeded chunks of PARALLEL_CHUNK_STEPS that are walked by a pool
+            of this many processes sharing the graph arrays. Results then depend on the
+            engine's seed but not on the number of processes.
+        :param early_stopping: (optional) Pixie's (n_p, n_v) early-stopping parameters
+            (e.g. PIXIE_EARLY_STOPPING) for walks from each seed; see
+            recommendations_for_node. Not supported together with num_processes.
+        :param use_visit_cache: Whether to combine cached per-seed visit counts instead
+            of walking from every seed; see weighted_recommendations.
+        """
+        if num_processes is not None and early_stopping is not None:
+            raise ValueError("Early stopping is not supported in parallel mode.")
+        self.convergence_stats = {}
         query_case_weights = self.input_node_weights(opinion_ids)
-        overall_node_freq_dict = {}
-        for node_id, weight in query_case_weights.items():
-            curr_max_num_steps = int(weight * max_num_steps)
-            curr_freq_dict = self.recommendations_for_node(
-                node_id,
-                num_recommendations=None,
-                max_walk_length=max_walk_length,
-                max_num_steps=curr_max_num_steps,
+        if use_visit_cache:
+            if early_stopping is not None:
+                raise ValueError(
+                    "Early stopping is not supported with the visit cache."
+                )
+            return self.weighted_recommendations(
+                query_case_weights,
+                num_recommendations,
+                max_walk_length,
+                max_num_steps,
+                num_processes,
+                exclude=opinion_ids,
             )
-            for node, freq in curr_freq_dict.items():
-                if node in opinion_ids:
-                    continue
-                if node not in overall_node_freq_dict:
-                    overall_node_freq_dict[node] = 0.0
-                    # overall_node_freq_dict[node] += sqrt(freq)  # See Eq. 3 of Eksombatchai et. al (2018)
-                    overall_node_freq_dict[
-                        node
-                    ] += freq  # See Eq. 3 of Eksombatchai et. al (2018)
-        top_n_recommendations = top_n(overall_node_freq_dict, num_recommendations)
+        step_budgets = {
+            node_id: int(weight * max_num_steps)
+            for node_id, weight in query_case_weights.items()
+        }
+        if num_processes is not None:
+            seed_visits = self.parallel_visit_counts(
+                step_budgets, max_walk_length, num_processes
+            )
+        else:
+            seed_visits = {
+                node_id: self.recommendations_for_node(
+                    node_id,
+                    num_recommendations=None,
+                    max_walk_length=max_walk_length,
+                    max_num_steps=curr_max_num_steps,
+                    early_stopping=early_stopping,
+                )
+                for node_id, curr_max_num_steps in step_budgets.items()
+            }
+        overall_visits = self.combine_visit_counts(
+            seed_visits, {node_id: 1.0 for node_id in seed_visits}, opinion_ids
+        )
+        top_n_recommendations = top_n(overall_visits, num_recommendations)
         return top_n_recommendations
 
+    def combine_visit_counts(
+        self,
+        seed_visits: Dict[int, ScoreVector],
+        seed_weights: Dict[int, float],
+        exclude=frozenset(),
+    ) -> ScoreVector:
+        """
+        Sums the visit counts of walks from each seed, scaled by the seed's weight, over
+        the graph's node index.
+
+        :param exclude: Node IDs to leave out of the result (e.g. the seeds)
+        :return: The summed counts of the nodes visited by any seed
+        """
+        graph = self.network_container.network_edge_list
+        visited = np.concatenate(
+            [np.empty(0, dtype="int64")]
+            + [graph.indices_of(visits.node_ids) for visits in seed_visits.values()]
+        )
+        weighted_counts = np.concatenate(
+            [np.empty(0)]
+            + [
+                seed_weights[node_id] * visits.values
+                for node_id, visits in seed_visits.items()
+            ]
+        )
+        # Visit counts are summed as is; Eq. 3 of Eksombatchai et. al (2018) would
+        # boost nodes visited from several seeds by summing sqrt(visits) instead
+        scores = np.bincount(
+            visited, weights=weighted_counts, minlength=graph.num_nodes
+        )
+        excluded = graph.indices_of(list(exclude))
+        scores[excluded[excluded >= 0]] = 0
+        scored = np.flatnonzero(scores)
+        return ScoreVector(graph.node_ids[scored], scores[scored])
+
+    def weighted_recommendations(
+        self,
+        seed_weights: Dict[int, float],
+        num_recommendations,
+        max_walk_length=MAX_WALK_LENGTH,
+        max_num_steps=MAX_NUM_STEPS,
+        num_processes=None,
+        exclude=frozenset(),
+    ) -> Dict[int, float]:
+        """
+        Recommendations for an arbitrary weighting of seed nodes, built from per-seed
+        visit counts cached on disk (see seed_visit_counts). Each seed's counts come from
+        a full budget of max_num_steps and are scaled by its weight, which matches the
+        expected counts of giving it a weight share of the budget. Only seeds missing
+        from the cache are walked, so re-weighting or subsetting cached seeds is cheap.
+
+        :param seed_weights: The weight of each seed node ID, e.g. from input_node_weights
+        :param exclude: Node IDs to leave out of the recommendations (e.g. the seeds)
+        :return: A dictionary of the top num_recommendations node IDs and their weighted
+            visit counts
+        """
+        seed_visits = self.seed_visit_counts(
+            [node_id for node_id, weight in seed_weights.items() if weight > 0],
+            max_walk_length,
+            max_num_steps,
+            num_processes,
+        )
+        return top_n(
+            self.combine_visit_counts(seed_visits, seed_weights, exclude),
+            num_recommendations,
+        )
+
+    def seed_visit_counts(
+        self,
+        node_ids,
+        max_walk_length=MAX_WALK_LENGTH,
+        max_num_steps=MAX_NUM_STEPS,
+        num_processes=None,
+    ) -> Dict[int, ScoreVector]:
+        """
+        Returns the visit counts of max_num_steps of walks from each seed
+        node, from the VisitCountCache of the current graph where possible. Missing seeds
+        are walked (in a process pool if num_processes is given) and added to the cache.
+        """
+        visit_cache = VisitCountCache(
+            self.network_container, max_walk_length, max_num_steps
+        )
+        seed_visits = {node_id: visit_cache.get(node_id) for node_id in node_ids}
+        missing = [node_id for node_id, visits in seed_visits.items() if visits is None]
+        if num_processes is not None:
+            new_visits = self.parallel_visit_counts(
+                {node_id: max_num_steps for node_id in missing},
+                max_walk_length,
+                num_processes,
+            )
+        else:
+            new_visits = {
+                node_id: self.recommendations_for_node(
+                    node_id, None, max_walk_length, max_num_steps
+                )
+                for node_id in missing
+            }
+        for node_id, visits in new_visits.items():
+            visit_cache.put(node_id, *visits)
+        seed_visits.update(new_visits)
+        return seed_visits
+
+    def parallel_visit_counts(
+        self, step_budgets: Dict[int, int], max_walk_length, num_processes
+    ) -> Dict[int, ScoreVector]:
+        """
+        Computes the visit counts of walks from each seed node in a process pool. The
+        walk adjacency is shared with the workers rather than copied to each of them
+        (see SharedArrays), and each chunk of a seed's budget gets its own seed derived
+        from the engine's generator, so the merged counts are reproducible.
+
+        :param step_budgets: The step budget for each seed node ID
+        :return: The visit counts for each seed node ID
+        """
+        graph = self.network_container.network_edge_list
+        entropy = int(self.rng.integers(2**63))
+        tasks, task_seeds = [], []
+        for seed_position, (node_id, num_steps) in enumerate(step_budgets.items()):
+            source_index = graph.index_of(node_id)
+            if source_index < 0 or graph.degree(node_id) == 0:
+                continue
+            for chunk_index, chunk_start in enumerate(
+                range(0, num_steps, PARALLEL_CHUNK_STEPS)
+            ):
+                seed_sequence = np.random.SeedSequence(
+                    entropy, spawn_key=(seed_position, chunk_index)
+                )
+                chunk_steps = min(PARALLEL_CHUNK_STEPS, num_steps - chunk_start)
+                tasks.append(
+                    (source_index, max_walk_length, chunk_steps, seed_sequence)
+                )
+                task_seeds.append(node_id)
+
+        chunk_counts = {node_id: [] for node_id in step_budgets}
+        indptr, indices = graph.adjacency()
+        if num_processes == 1:
+            for node_id, task in zip(task_seeds, tasks):
+                chunk_counts[node_id].append(_walk_chunk(task, (indptr, indices)))
+        else:
+            with SharedArrays({"indptr": indptr, "indices": indices}) as handle, Pool(
+                num_processes, initializer=_init_walk_worker, initargs=(handle,)
+            ) as pool:
+                for node_id, counts in zip(task_seeds, pool.imap(_walk_chunk, tasks)):
+                    chunk_counts[node_id].append(counts)
+
+        seed_visits = {}
+        for node_id, counts in chunk_counts.items():
+            visited = np.concatenate(
+                [np.empty(0, dtype="int64")] + [c[0] for c in counts]
+            )
+            visits = np.concatenate(
+                [np.empty(0, dtype="int64")] + [c[1] for c in counts]
+            )
+            visit_counts = np.bincount(visited, weights=visits).astype("int64")
+            visited = np.flatnonzero(visit_counts)
+            seed_visits[node_id] = ScoreVector(
+                graph.node_ids[visited], visit_counts[visited]
+            )
+        return seed_visits
+
     def recommendations_for_node(
         self,
         opinion_id,
         num_recommendations,
         max_walk_length=MAX_WALK_LENGTH,
         max_num_steps=MAX_NUM_STEPS,
-    ) -> Dict[int, float]:
+        early_stopping: Optional[Tuple[int, int]] = None,
+    ) -> Union[Dict[int, float], ScoreVector]:
         """
         Random-walk recommendation algorithm to return relevant cases given a case ID. Heavily based on
-        Eksombatchai et. al (2018)'s Pixie recommendation algorithm for Pinterest.
+        Eksombatchai et. al (2018)'s Pixie recommendation algorithm for Pinterest. Walks are run
+        in vectorized batches of WALK_BATCH_SIZE using the engine's seeded generator.
 
         :param opinion_id: The opinion ID to get recommendations for (source for the random walks)
         :param num_recommendations: The number of cases to return
         :param max_walk_length: Maximum number of steps to perform in a single random walk
         :param max_num_steps: The upper bound of random-walk steps to execute while computing recommendations
-        :return: A dictionary of the top num_recommendation opinion IDs and their visit values
-        """
-        node_freq_dict = {}
-        num_steps = 0
-        while (
-            num_steps < max_num_steps
-        ):  # Keep a constant worst-case bound on execution time
-            random_walk_dest, walk_length = self.random_walker.random_walk(
-                opinion_id, max_walk_length=5
+        :param early_stopping: (optional) Pixie's (n_p, n_v) parameters: stop once n_p nodes have each been
+            visited at least n_v times, even if steps are left in the budget. Checked after every walk.
+        :return: A dictionary of the top num_recommendation opinion IDs and their visit values (the
+            ScoreVector of all visited nodes if num_recommendations is None). Convergence statistics of the
+            walks are stored in convergence_stats[opinion_id].
+        """
+        graph = self.network_container.network_edge_list
+        source_index = graph.index_of(opinion_id)
+        # Walks ending at the source don't count towards the step budget, so a source
+        # without neighbors would never use it up
+        if source_index < 0 or graph.degree(opinion_id) == 0:
+            return top_n(
+                ScoreVector(np.empty(0, dtype="int64"), np.empty(0, dtype="int64")),
+                num_recommendations,
             )
-            if random_walk_dest == opinion_id:
-                continue
-            if random_walk_dest not in node_freq_dict:
-                node_freq_dict[random_walk_dest] = 0
-            node_freq_dict[random_walk_dest] += 1
-            num_steps += walk_length
-        return top_n(node_freq_dict, num_recommendations)
+        indptr, indices = graph.adjacency()
+        destinations, self.convergence_stats[opinion_id] = walk_destinations(
+            indptr,
+            indices,
+            source_index,
+            max_walk_length,
+            max_num_steps,
+            self.rng,
+            early_stopping=early_stopping,
+            track_convergence=True,
+        )
+        visit_counts = np.bincount(destinations)
+        visited = np.flatnonzero(visit_counts)
+        return top_n(
+            ScoreVector(graph.node_ids[visited], visit_counts[visited]),
+            num_recommendations,
+        )
 
     def input_node_weights(self, opinion_ids) -> Dict[int, float]:
         """
@@ -90,14 +341,13 @@ class Recommendation:
         """
         total_num_edges, max_degree = 0, 0
         node_degrees = {}
+        graph = self.network_container.network_edge_list
         for op_id in opinion_ids:
-            node_metadata = self.network_container.network_edge_list.node_metadata[
-                op_id
-            ]
-            node_degrees[op_id] = node_metadata.length
-            total_num_edges += node_metadata.length
-            if node_metadata.length > max_degree:
-                max_degree = node_metadata.length
+            node_degree = graph.degree(op_id)
+            node_degrees[op_id] = node_degree
+            total_num_edges += node_degree
+            if node_degree > max_degree:
+                max_degree = node_degree
         if total_num_edges == 0:
             return {op_id: 0 for op_id in opinion_ids}
         denormalized_weights = {
@@ -114,4 +364,141 @@ class Recommendation:
         return normalized_weights
 
     def denormalized_node_weight(self, node_degree, max_degree, total_num_edges):
+        if node_degree == 0:
+            return 0.0
         return (node_degree * (max_degree - log(node_degree))) / total_num_edges
+
+
+def walk_destinations(
+    indptr,
+    indices,
+    source_index,
+    max_walk_length,
+    max_num_steps,
+    rng,
+    early_stopping=None,
+    track_convergence=False,
+) -> Tuple[np.ndarray, ConvergenceStats]:
+    """
+    Runs batches of WALK_BATCH_SIZE random walks from source_index until max_num_steps
+    steps are used up, and returns the destination indices of the counted walks. Walks
+    ending at the source don't count (nor do their steps), and like walking one at a
+    time, the walk that exhausts the budget is the last one counted.
+
+    :param early_stopping: (optional) Pixie's (n_p, n_v) parameters: stop at the first
+        walk after which n_p nodes have been visited at least n_v times
+    :param track_convergence: Whether to track the top-k stability of the visit counts
+        (early stopping implies tracking visit counts), in batches of about a
+        CONVERGENCE_NUM_BATCHES-th of the budget
+    :return: The destinations, and statistics about the walks' convergence
+    """
+    num_candidates, min_visits = early_stopping or (None, None)
+    track_convergence = track_convergence or early_stopping is not None
+    visit_counts = (
+        np.zeros(len(indptr) - 1, dtype="int64") if track_convergence else None
+    )
+    batch_size = WALK_BATCH_SIZE
+    if track_convergence:
+        # Walk lengths are uniform in [1, max_walk_length]
+        mean_walk_length = (max_walk_length + 1) / 2
+        batch_size = int(
+            np.clip(
+                max_num_steps / (mean_walk_length * CONVERGENCE_NUM_BATCHES),
+                1,
+                WALK_BATCH_SIZE,
+            )
+        )
+    visited = np.empty(0, dtype="int64")
+    prev_top_k, top_k_stability = None, None
+    num_converged, early_stopped = 0, False
+
+    destinations = [np.empty(0, dtype="int64")]
+    num_steps = 0
+    while (
+        num_steps < max_num_steps
+    ):  # Keep a constant worst-case bound on execution time
+        random_walk_dests, walk_lengths = batched_random_walks(
+            indptr, indices, source_index, batch_size, max_walk_length, rng
+        )
+        counted = random_walk_dests != source_index
+        if not counted.any():
+            break
+        steps_so_far = num_steps + np.cumsum(np.where(counted, walk_lengths, 0))
+        num_walks = min(np.searchsorted(steps_so_far, max_num_steps) + 1, batch_size)
+        batch_dests = random_walk_dests[:num_walks][counted[:num_walks]]
+        if early_stopping is not None and len(batch_dests):
+            # The visit count each walk brings its destination to, to find the walk
+            # after which the n_p-th node reaches n_v visits
+            order = np.argsort(batch_dests, kind="stable")
+            sorted_dests = batch_dests[order]
+            run_starts = np.flatnonzero(
+                np.concatenate([[True], sorted_dests[1:] != sorted_dests[:-1]])
+            )
+            run_ranks = np.arange(len(order)) - np.repeat(
+                run_starts, np.diff(np.append(run_starts, len(order)))
+            )
+            visits_after = np.empty(len(order), dtype="int64")
+            visits_after[order] = visit_counts[sorted_dests] + run_ranks + 1
+            converged = np.cumsum(visits_after == min_visits)
+            if num_converged + converged[-1] >= num_candidates:
+                last_walk = np.searchsorted(converged, num_candidates - num_converged)
+                batch_dests = batch_dests[: last_walk + 1]
+                num_walks = np.flatnonzero(counted[:num_walks])[last_walk] + 1
+                early_stopped = True
+        destinations.append(batch_dests)
+        num_steps = steps_so_far[num_walks - 1]
+        if not track_convergence:
+            continue
+
+        batch_nodes, batch_visits = np.unique(batch_dests, return_counts=True)
+        prev_visits = visit_counts[batch_nodes]
+        visit_counts[batch_nodes] += batch_visits
+        visited = np.union1d(visited, batch_nodes)
+        top_k = visited
+        if len(visited) > CONVERGENCE_TOP_K:
+            top_k = visited[
+                np.argpartition(-visit_counts[visited], CONVERGENCE_TOP_K - 1)[
+                    :CONVERGENCE_TOP_K
+                ]
+            ]
+        if prev_top_k is not None:
+            top_k_stability = len(np.intersect1d(top_k, prev_top_k)) / len(top_k)
+        prev_top_k = top_k
+        if early_stopping is not None:
+            num_converged += np.count_nonzero(
+                (prev_visits < min_visits) & (prev_visits + batch_visits >= min_visits)
+            )
+            if early_stopped:
+                break
+
+    destinations = np.concatenate(destinations)
+    stats = ConvergenceStats(
+        num_steps=int(num_steps),
+        num_walks=len(destinations),
+        # Stopping on the walk that also used up the budget isn't stopping early
+        early_stopped=bool(early_stopped and num_steps < max_num_steps),
+        top_k_stability=top_k_stability,
+    )
+    return destinations, stats
+
+
+# Walk adjacency of a parallel_visit_counts worker process, set by _init_walk_worker
+_worker_adjacency = None
+
+
+def _init_walk_worker(handle):
+    global _worker_adjacency
+    arrays = attach_arrays(handle)
+    _worker_adjacency = (arrays["indptr"], arrays["indices"])
+
+
+def _walk_chunk(task, adjacency=None):
+    source_index, max_walk_length, max_num_steps, seed_sequence = task
+    destinations, _ = walk_destinations(
+        *(adjacency or _worker_adjacency),
+        source_index,
+        max_walk_length,
+        max_num_steps,
+        np.random.default_rng(seed_sequence),
+    )
+    return np.unique(destinations, return_counts=True)
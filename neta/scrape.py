@@ -1,13 +1,16 @@
 # TODO: resume scraping - possibly save chains
 
+import asyncio
+import functools
 import logging
 import os
 import sys
-import time
 from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
 from queue import SimpleQueue
-from typing import List, Union
+from typing import List, Optional, Union
 
 import pandas as pd
 import psycopg2
@@ -15,6 +18,7 @@ import requests
 from dotenv import load_dotenv
 
 from neta.constants import PROJECT_DIR
+from neta.rate_limit import CredentialPool
 
 load_dotenv(dotenv_path=(PROJECT_DIR / ".env"))
 dbname = os.environ.get("DBNAME")
@@ -24,8 +28,15 @@ host = os.environ.get("DBHOST")
 port = os.environ.get("DBPORT")
 
 bearer_token = os.environ.get("BEARER_TOKEN")
+# Comma-separated tokens of several developer apps
+bearer_tokens = [
+    token.strip()
+    for token in os.environ.get("BEARER_TOKENS", "").split(",")
+    if token.strip()
+] or [bearer_token]
 
-HEADERS = {"Authorization": "Bearer {}".format(bearer_token)}
+# Can point at a local stand-in server for testing
+API_BASE_URL = os.environ.get("TWITTER_API_URL", "https://api.twitter.com/2")
 
 # Need to correspond to user table in DB!
 USER_FIELDS = [
@@ -49,8 +60,9 @@ PARAMS = {
     "user.fields": f"{','.join(USER_FIELDS)},public_metrics",
 }
 
-# Global variable to spread out requests over 15-min windows
-last_request = -1
+# Credentials of the sequential requests (see connect_to_endpoint), paced by the rate
+# limit of each endpoint
+sequential_pool = CredentialPool(bearer_tokens)
 
 
 def connect_create():
@@ -142,65 +154,63 @@ def get_params(pagination_token=None, max_results=1000):
         return dict(PARAMS, pagination_token=pagination_token)
 
 
-def url_follows(user_id, follow="following"):
+def url_follows(user_id, follow="following", base_url=API_BASE_URL):
     """Create URL accessing the followers/following APIv2.
 
     :param user_id: user ID to query followers/ing of
     :param follow: 'following' or 'followers'
+    :param base_url: API URL to prefix (API_BASE_URL by default)
     """
     assert follow in ("following", "followers")
-    return f"https://api.twitter.com/2/users/{user_id}/{follow}"
+    return f"{base_url}/users/{user_id}/{follow}"
 
 
-def url_user_lookup(users, by="id"):
+def url_user_lookup(users, by="id", base_url=API_BASE_URL):
     lookup = ",".join(map(str, users))
     if by == "id":
-        url = f"https://api.twitter.com/2/users?ids={lookup}"
+        url = f"{base_url}/users?ids={lookup}"
     else:  # handle lookup
-        url = f"https://api.twitter.com/2/users/by?usernames={lookup}"
+        url = f"{base_url}/users/by?usernames={lookup}"
     return url
 
 
-def connect_to_endpoint(url, next_token=None, tpr=60, max_results=1000, wait=True):
-    """Connect to twitter API and return JSON response.  Spreads
+def connect_to_endpoint(
+    url, next_token=None, endpoint="follows", max_results=1000, pool=None
+):
+    """Connect to twitter API and return JSON response.  Sends the request with the
+    credential whose rate limit for the endpoint frees up soonest (see CredentialPool),
+    waiting until one has quota left.  Rate-limited requests are retried, with another
+    credential if one has quota left.
 
     :param url: API URL
     :param next_token: pagination token if multiple pages of results
-    :param tpr: time-per-request (60 for follows, as 15 requests allowed per 15min
-        window)
+    :param endpoint: rate-limit bucket of the URL ("follows" or "lookup")
     :param max_results: for follower lookup, amount of results per page (max 1000);
         should be None for user lookup
+    :param pool: (optional) CredentialPool to send the request with, sequential_pool
+        by default
     """
-    global last_request
-    # Hack to spread out requests over the window - always request every TPR seconds
-    t = time.time()
-    time_to_wait = tpr - (t - last_request)
-    if wait and (time_to_wait > 0):
-        time.sleep(time_to_wait)
-    else:
-        time_to_wait = 0
-    last_request = time.time()
-
-    response = requests.request(
-        "GET", url, headers=HEADERS, params=get_params(next_token, max_results)
-    )
-    if response.status_code == 429:
-        rem = int(response.headers.get("x-rate-limit-reset"))
-        logging.info(f"Rate-limited. Waiting {rem - t} seconds and trying again")
-        time.sleep(rem - t)
+    pool = pool or sequential_pool
+    while True:
+        credential = pool.acquire_blocking(endpoint)
         response = requests.request(
             "GET",
             url,
-            headers=HEADERS,
+            headers=pool.headers(credential),
             params=get_params(next_token, max_results),
         )
+        rate_limited = response.status_code == 429
+        pool.update(credential, endpoint, response.headers, rate_limited)
+        if not rate_limited:
+            break
+        logging.info(f"Rate-limited on {url} with credential {credential}. Retrying")
     if response.status_code != 200:
         e = Exception(
             f"Request {url} returned an error: {response.status_code} {response.text}"
         )
         logging.exception(e)
         return -1
-    logging.info(f"Request {url}: {response.status_code} (waited {time_to_wait:.2f}s)")
+    logging.info(f"Request {url}: {response.status_code}")
     return response.json()
 
 
@@ -226,24 +236,9 @@ def get_follows(conn, user_id, method="following", filter_metric_above=5000):
     ids = []
     followers = []
     while has_data:
-        data = response["data"]
-        for user in data:
-            try:
-                # Store user/edge and add to Series of users' followers counts
-                # User may already be stored, in which case the DB does nothing
-                store_user(conn, user)
-                if method == "following":
-                    store_edge(conn, user_id, user["id"])
-                elif method == "followers":
-                    store_edge(conn, user["id"], user_id)
-                # Check the metric of the method, but store always followers_count
-                metric = int(user["public_metrics"][f"{method}_count"])
-                if metric <= filter_metric_above:
-                    ids.append(int(user["id"]))
-                    followers.append(int(user["public_metrics"]["followers_count"]))
-            except Exception as e:
-                logging.exception(e)
-        conn.commit()
+        store_follows(
+            conn, user_id, response["data"], method, filter_metric_above, ids, followers
+        )
         # Pagination - if >1000 results exist we'll have to make multiple requests
         if "next_token" in response["meta"]:
             response = connect_to_endpoint(url, response["meta"]["next_token"])
@@ -254,6 +249,28 @@ def get_follows(conn, user_id, method="following", filter_metric_above=5000):
     return follows.sort_values(ascending=False).index.to_list()
 
 
+def store_follows(conn, user_id, data, method, filter_metric_above, ids, followers):
+    """Stores a page of follow{ers/ing} of a user in the DB, and appends the ids and
+    followers counts of those below filter_metric_above to ids and followers."""
+    for user in data:
+        try:
+            # Store user/edge and add to Series of users' followers counts
+            # User may already be stored, in which case the DB does nothing
+            store_user(conn, user)
+            if method == "following":
+                store_edge(conn, user_id, user["id"])
+            elif method == "followers":
+                store_edge(conn, user["id"], user_id)
+            # Check the metric of the method, but store always followers_count
+            metric = int(user["public_metrics"][f"{method}_count"])
+            if metric <= filter_metric_above:
+                ids.append(int(user["id"]))
+                followers.append(int(user["public_metrics"]["followers_count"]))
+        except Exception as e:
+            logging.exception(e)
+    conn.commit()
+
+
 def lookup_initial_ids(conn, users, id=False):
     """Looks up and stores initial users in DB, returning their ids.
 
@@ -262,7 +279,7 @@ def lookup_initial_ids(conn, users, id=False):
     :param id: boolean indicating whether lookup happens through handle or ID
     """
     url = url_user_lookup(users, by="id" if id else "handle")
-    response = connect_to_endpoint(url, max_results=None, tpr=15 / 300)  # 300rp15m
+    response = connect_to_endpoint(url, endpoint="lookup", max_results=None)
     data = response["data"]
 
     ids = []
@@ -274,6 +291,225 @@ def lookup_initial_ids(conn, users, id=False):
     return ids
 
 
+def load_progress(edges_dir: Path) -> pd.Series:
+    """Sets up logging to edges_dir and returns the edges scraped so far (follows by
+    user ID)."""
+    logging.basicConfig(
+        filename=edges_dir / "scrape.log",
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(name)-15s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    ef = edges_dir / "edges.pkl"
+    if ef.is_file():
+        return pd.read_pickle(ef)
+    return pd.Series(dtype=int)
+
+
+async def fetch(
+    url,
+    endpoint,
+    pool: CredentialPool,
+    next_token=None,
+    max_results=1000,
+):
+    """Async connect_to_endpoint: runs the (blocking) request in a worker thread so other
+    requests can proceed meanwhile, and waits for a credential without blocking the
+    event loop.
+
+    :param endpoint: rate-limit bucket of the URL ("follows" or "lookup")
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        credential = await pool.acquire(endpoint)
+        response = await loop.run_in_executor(
+            None,
+            functools.partial(
+                requests.request,
+                "GET",
+                url,
+                headers=pool.headers(credential),
+                params=get_params(next_token, max_results),
+            ),
+        )
+        rate_limited = response.status_code == 429
+        pool.update(credential, endpoint, response.headers, rate_limited)
+        if not rate_limited:
+            break
+        logging.info(f"Rate-limited on {url} with credential {credential}. Retrying")
+    if response.status_code != 200:
+        e = Exception(
+            f"Request {url} returned an error: {response.status_code} {response.text}"
+        )
+        logging.exception(e)
+        return -1
+    logging.info(f"Request {url}: {response.status_code}")
+    return response.json()
+
+
+async def fetch_follows(
+    conn,
+    user_id,
+    pool: CredentialPool,
+    method="following",
+    filter_metric_above=5000,
+    base_url=API_BASE_URL,
+    db_executor: Optional[Executor] = None,
+):
+    """Async get_follows (see fetch). The pages are stored in db_executor (the default
+    executor if omitted), so the event loop isn't blocked by the DB.
+    """
+    loop = asyncio.get_running_loop()
+    url = url_follows(user_id, method, base_url)
+    response = await fetch(url, "follows", pool)
+    has_data = response != -1
+
+    ids = []
+    followers = []
+    while has_data:
+        await loop.run_in_executor(
+            db_executor,
+            functools.partial(
+                store_follows,
+                conn,
+                user_id,
+                response["data"],
+                method,
+                filter_metric_above,
+                ids,
+                followers,
+            ),
+        )
+        if "next_token" in response["meta"]:
+            response = await fetch(url, "follows", pool, response["meta"]["next_token"])
+            has_data = response != -1
+        else:
+            has_data = False
+
+    follows = pd.Series(followers, index=ids)
+    return follows.sort_values(ascending=False).index.to_list()
+
+
+async def crawl(
+    users: List[str],
+    topn: int = 15,
+    n_degrees: int = 6,
+    method: str = "following",
+    filter_metric_above=5000,
+    edges_dir: Union[Path, str] = ".",
+    save_every: int = 10,
+    concurrency: int = 4,
+    base_url=API_BASE_URL,
+    pool: Optional[CredentialPool] = None,
+):
+    """Async main: scrapes up to concurrency users at once, so requests to the lookup
+    and follows endpoints overlap and each endpoint's rate limit is used up, for each
+    credential in the pool. Users are still explored breadth-first, up to n_degrees from
+    the initial users.
+
+    :param concurrency: number of users to scrape at once
+    :param base_url: API URL to prefix (API_BASE_URL by default)
+    :param pool: (optional) CredentialPool to send requests with, by default one of
+        bearer_tokens (BEARER_TOKENS or BEARER_TOKEN) with the documented limits
+    """
+    edges_dir = Path(edges_dir)
+    edges = load_progress(edges_dir)
+    ef = edges_dir / "edges.pkl"
+    pool = pool or CredentialPool(bearer_tokens)
+    # All DB work runs on one thread, off the event loop and one call at a time, as it
+    # shares the connection
+    db_executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+    conn = await loop.run_in_executor(db_executor, connect_create)
+    logging.info("Connected to database.")
+
+    def store_users(data):
+        for user in data:
+            store_user(conn, user)
+        conn.commit()
+
+    id = pd.Series(users, dtype=str).str.isnumeric().all()
+    url = url_user_lookup(users, by="id" if id else "handle", base_url=base_url)
+    response = await fetch(url, "lookup", pool, max_results=None)
+    await loop.run_in_executor(db_executor, store_users, response["data"])
+    ids = [user["id"] for user in response["data"]]
+    logging.info("Stored initial ids in DB.")
+
+    q = asyncio.Queue()
+    # Users in the queue, to dump for resumption (see main)
+    queued = Counter()
+    started = set()
+    num_scraped = 0
+    for user_id in ids:
+        q.put_nowait([0, user_id])
+        queued[user_id] += 1
+
+    async def scrape_users():
+        nonlocal edges, num_scraped
+        while True:
+            follow_chain = await q.get()
+            user_id = follow_chain[-1]
+            parent_id = follow_chain[-2]
+            queued[user_id] -= 1
+            try:
+                if user_id in edges or user_id in started:
+                    logging.info(
+                        f"Skipping user {user_id} (parent {parent_id}) "
+                        "[already in edges]"
+                    )
+                    continue
+                started.add(user_id)
+                logging.info(
+                    f"Scraping follows of user {user_id} (parent {parent_id})."
+                )
+                try:
+                    follows = await fetch_follows(
+                        conn,
+                        user_id,
+                        pool,
+                        method,
+                        filter_metric_above,
+                        base_url,
+                        db_executor,
+                    )
+                    edges = pd.concat(
+                        [
+                            edges,
+                            pd.Series(
+                                follows, index=[user_id] * len(follows), dtype=int
+                            ),
+                        ]
+                    )
+                    if (len(follow_chain) - 1) < n_degrees:
+                        for follow_id in follows[:topn]:
+                            q.put_nowait(follow_chain + [follow_id])
+                            queued[follow_id] += 1
+                except Exception as e:
+                    logging.error(
+                        f"ID {user_id} failed (could be e.g. private or suspended)"
+                    )
+                    logging.exception(e)
+
+                if num_scraped % save_every == 0:
+                    edges.to_pickle(ef)
+                    pd.Series(
+                        [x for x, count in queued.items() if count > 0]
+                    ).to_pickle(edges_dir / "queue.pkl")
+                num_scraped += 1
+            finally:
+                q.task_done()
+
+    workers = [asyncio.ensure_future(scrape_users()) for _ in range(concurrency)]
+    # The queue runs empty once every chain has reached n_degrees
+    await q.join()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    edges.to_pickle(ef)
+    await loop.run_in_executor(db_executor, conn.close)
+    db_executor.shutdown()
+
+
 def main(
     users: List[str],
     topn: int = 15,
@@ -299,19 +535,9 @@ def main(
         saved to DB - this is for ad-hoc checks)
     """
     edges_dir = Path(edges_dir)
-    logging.basicConfig(
-        filename=edges_dir / "scrape.log",
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)-8s %(name)-15s %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    edges = load_progress(edges_dir)
     ef = edges_dir / "edges.pkl"
 
-    if ef.is_file():
-        edges = pd.read_pickle(ef)
-    else:
-        edges = pd.Series(dtype=int)
-
     # edges = pd.Series(dtype=int)
     conn = connect_create()
     logging.info("Connected to database.")
@@ -346,8 +572,8 @@ def main(
         logging.info(f"Scraping follows of user {user_id} (parent {parent_id}).")
         try:
             follows = get_follows(conn, user_id, method)
-            edges = edges.append(
-                pd.Series(follows, index=[user_id] * len(follows), dtype=int)
+            edges = pd.concat(
+                [edges, pd.Series(follows, index=[user_id] * len(follows), dtype=int)]
             )
             # Until the desired max degree is reached, add to the follow chain the n
             # most followed connections to continue scraping
@@ -429,6 +655,25 @@ if __name__ == "__main__":
         help="Save edges.pkl (edge list) every n scraped users"
         "(edges are also saved to DB - this is for ad-hoc checks)",
     )
+    parser.add_argument(
+        "--concurrency",
+        default=None,
+        type=int,
+        help="Scrape this many users at once with the asyncio crawler. (Default: one "
+        "user at a time)",
+    )
+    parser.add_argument(
+        "--base_url",
+        default=API_BASE_URL,
+        type=str,
+        help="Twitter API URL, e.g. of a local stand-in server. Only used with "
+        "--concurrency.",
+    )
 
-    args = parser.parse_args()
-    main(**args.__dict__)
+    args = parser.parse_args().__dict__
+    concurrency = args.pop("concurrency")
+    base_url = args.pop("base_url")
+    if concurrency is None:
+        main(**args)
+    else:
+        asyncio.run(crawl(**args, concurrency=concurrency, base_url=base_url))
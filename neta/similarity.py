@@ -0,0 +1,233 @@
+"""
+MinHash signatures of the nodes' neighborhoods with an LSH banding index, for finding
+the accounts most similar (by Jaccard index of their follows) to a given account
+without scanning the whole network.
+"""
+
+import json
+import os
+from typing import Dict
+
+import numpy as np
+
+from neta.graph import NetworkContainer, NetworkEdgeList
+from neta.helpers import ScoreVector, top_n
+
+NUM_PERMUTATIONS = 64
+# Signature rows per LSH band. Fewer rows per band give more bands, which find pairs
+# with lower similarity (roughly above (1 / num_bands) ** (1 / band_rows)) at the cost
+# of larger candidate sets.
+BAND_ROWS = 2
+# Modulus of the universal hash functions (a Mersenne prime above any node index)
+HASH_PRIME = (1 << 31) - 1
+# Signature value of nodes without neighbors, which are left out of the index
+EMPTY_SIGNATURE = np.iinfo("uint32").max
+INDEX_ARRAYS = ("hash_params", "signatures", "band_keys", "band_nodes")
+
+
+class MinHashIndex:
+    """
+    MinHash signatures of the neighborhoods (along the default direction) of all nodes
+    of a NetworkEdgeList, plus an LSH index that maps each band of a signature to the
+    nodes sharing it. Two nodes share a band with a probability that grows steeply with
+    the Jaccard index of their neighborhoods, so the nodes sharing any band with a query
+    node are its likely most similar nodes.
+    """
+
+    network_edge_list: NetworkEdgeList
+    # (2, num_permutations) multipliers and offsets of the hash functions
+    hash_params: np.ndarray
+    # (num_nodes, num_permutations) minimum hash of each node's neighbors
+    signatures: np.ndarray
+    # (num_bands, num_indexed) sorted band hashes, and the node index of each
+    band_keys: np.ndarray
+    band_nodes: np.ndarray
+
+    def __init__(
+        self,
+        network_edge_list: NetworkEdgeList,
+        num_permutations=NUM_PERMUTATIONS,
+        band_rows=BAND_ROWS,
+        seed=0,
+    ):
+        if num_permutations % band_rows:
+            raise ValueError("num_permutations must be a multiple of band_rows.")
+        self.network_edge_list = network_edge_list
+        rng = np.random.default_rng(seed)
+        self.hash_params = np.stack(
+            [
+                rng.integers(1, HASH_PRIME, num_permutations, dtype="uint64"),
+                rng.integers(0, HASH_PRIME, num_permutations, dtype="uint64"),
+            ]
+        )
+        self.signatures = self.compute_signatures()
+        self.band_keys, self.band_nodes = self.build_bands(band_rows)
+
+    def compute_signatures(self) -> np.ndarray:
+        """Computes the signatures one hash function at a time over the CSR arrays."""
+        indptr, indices = self.network_edge_list.adjacency()
+        has_neighbors = np.diff(indptr) > 0
+        row_starts = indptr[:-1][has_neighbors]
+        neighbors = np.asarray(indices, dtype="uint64")
+        signatures = np.full(
+            (self.network_edge_list.num_nodes, self.num_permutations),
+            EMPTY_SIGNATURE,
+            dtype="uint32",
+        )
+        for permutation, (multiplier, offset) in enumerate(self.hash_params.T):
+            hashes = (multiplier * neighbors + offset) % HASH_PRIME
+            if len(row_starts):
+                signatures[has_neighbors, permutation] = np.minimum.reduceat(
+                    hashes, row_starts
+                )
+        return signatures
+
+    def build_bands(self, band_rows):
+        """Hashes each band of the signatures and sorts the nodes by band hash."""
+        indexed = np.flatnonzero(self.signatures[:, 0] != EMPTY_SIGNATURE)
+        num_bands = self.num_permutations // band_rows
+        band_keys = np.empty((num_bands, len(indexed)), dtype="uint64")
+        band_nodes = np.empty((num_bands, len(indexed)), dtype="int32")
+        for band in range(num_bands):
+            keys = self._band_hashes(self.signatures[indexed], band, band_rows)
+            order = np.argsort(keys, kind="stable")
+            band_keys[band], band_nodes[band] = keys[order], indexed[order]
+        return band_keys, band_nodes
+
+    @staticmethod
+    def _band_hashes(signatures, band, band_rows) -> np.ndarray:
+        keys = np.zeros(len(signatures), dtype="uint64")
+        for row in range(band * band_rows, (band + 1) * band_rows):
+            # Multiplication wraps around, which is fine for hashing
+            keys = keys * np.uint64(1000003) ^ signatures[:, row].astype("uint64")
+        return keys
+
+    @property
+    def num_permutations(self) -> int:
+        return self.hash_params.shape[1]
+
+    @property
+    def band_rows(self) -> int:
+        return self.num_permutations // len(self.band_keys)
+
+    def candidates(self, node_index: int) -> np.ndarray:
+        """Returns the indices of the nodes sharing at least one band with node_index."""
+        if self.signatures[node_index, 0] == EMPTY_SIGNATURE:
+            return np.empty(0, dtype="int64")
+        buckets = [np.empty(0, dtype="int32")]
+        for band in range(len(self.band_keys)):
+            key = self._band_hashes(
+                self.signatures[node_index : node_index + 1], band, self.band_rows
+            )[0]
+            start, end = np.searchsorted(self.band_keys[band], [key, key + 1])
+            buckets.append(self.band_nodes[band][start:end])
+        candidates = np.unique(np.concatenate(buckets)).astype("int64")
+        return candidates[candidates != node_index]
+
+    def alignment(self, node_id, exact=False) -> ScoreVector:
+        """
+        Similarity of node_id's neighborhood to those of its LSH candidates: the share of
+        matching signature values (an unbiased estimate of the Jaccard index), or the
+        exact Jaccard index of the candidates if exact is True. The cost depends on the
+        size of the candidate set rather than the network.
+        """
+        graph = self.network_edge_list
+        node_index = graph.index_of(node_id)
+        if node_index < 0:
+            return ScoreVector(np.empty(0, dtype="int64"), np.empty(0))
+        candidates = self.candidates(node_index)
+        if exact:
+            scores = self.exact_jaccards(node_index, candidates)
+        else:
+            scores = np.mean(
+                self.signatures[candidates] == self.signatures[node_index], axis=1
+            )
+        return ScoreVector(graph.node_ids[candidates], scores)
+
+    def exact_jaccards(self, node_index: int, candidates: np.ndarray) -> np.ndarray:
+        """Jaccard index of node_index's neighborhood with each candidate's."""
+        graph = self.network_edge_list
+        indptr, indices = graph.adjacency()
+        is_neighbor = np.zeros(graph.num_nodes, dtype=bool)
+        is_neighbor[graph.neighbor_indices(node_index)] = True
+        degrees = np.diff(indptr)
+        candidate_degrees = degrees[candidates]
+        neighbor_positions = np.repeat(
+            indptr[candidates] - np.cumsum(candidate_degrees) + candidate_degrees,
+            candidate_degrees,
+        ) + np.arange(candidate_degrees.sum())
+        intersections = np.bincount(
+            np.repeat(np.arange(len(candidates)), candidate_degrees),
+            weights=is_neighbor[indices[neighbor_positions]],
+            minlength=len(candidates),
+        )
+        unions = candidate_degrees + degrees[node_index] - intersections
+        return intersections / unions
+
+    def most_similar(self, node_id, k=10, exact=False) -> Dict[int, float]:
+        """
+        Returns the k accounts most similar to node_id among its LSH candidates, ranked
+        by estimated Jaccard index, or re-ranked by the exact one if exact is True.
+        """
+        return top_n(self.alignment(node_id, exact), k)
+
+    def save(self, index_dir, **header_fields):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            array_path = os.path.join(index_dir, f"{name}.npy")
+            tmp_path = f"{array_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as array_file:
+                np.save(array_file, getattr(self, name))
+            os.replace(tmp_path, array_path)
+        header_path = os.path.join(index_dir, "header.json")
+        with open(f"{header_path}.{os.getpid()}.tmp", "w") as header_file:
+            json.dump(
+                {"num_nodes": self.network_edge_list.num_nodes, **header_fields},
+                header_file,
+            )
+        os.replace(f"{header_path}.{os.getpid()}.tmp", header_path)
+
+    @classmethod
+    def load(cls, index_dir, network_edge_list: NetworkEdgeList, mmap_mode="r"):
+        with open(os.path.join(index_dir, "header.json")) as header_file:
+            header = json.load(header_file)
+        if header["num_nodes"] != network_edge_list.num_nodes:
+            raise ValueError("MinHash index does not match the network.")
+        index = cls.__new__(cls)
+        index.network_edge_list = network_edge_list
+        for name in INDEX_ARRAYS:
+            setattr(
+                index,
+                name,
+                np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode=mmap_mode),
+            )
+        return index
+
+    @classmethod
+    def for_network(
+        cls,
+        network_container: NetworkContainer,
+        num_permutations=NUM_PERMUTATIONS,
+        band_rows=BAND_ROWS,
+    ):
+        """
+        Returns the index of a network, loaded from next to the cached network if it was
+        built for the same state of the graph before, and built and saved otherwise.
+        """
+        graph = network_container.network_edge_list
+        if network_container.fingerprint is None:
+            return cls(graph, num_permutations, band_rows)
+        index_dir = os.path.join(
+            network_container.cache_dir,
+            "minhash",
+            f"{network_container.version}-delta{network_container.delta_edges}"
+            f"-perm{num_permutations}-rows{band_rows}",
+        )
+        try:
+            return cls.load(index_dir, graph)
+        except (OSError, ValueError, KeyError):
+            pass
+        print("Building MinHash index.")
+        index = cls(graph, num_permutations, band_rows)
+        index.save(index_dir)
+        return index
@@ -0,0 +1,50 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from neta.graph import NetworkContainer
+from neta.helpers import ScoreVector
+
+
+class VisitCountCache:
+    """
+    On-disk cache of the visit counts of random walks from single seed nodes, stored as
+    sparse (node IDs, counts) vectors. Entries live next to the cached network and are
+    keyed by the state of the graph (edge fingerprint, directedness and delta-log edges)
+    and the walk parameters, so they are never reused for a different graph or walk.
+    """
+
+    def __init__(
+        self, network_container: NetworkContainer, max_walk_length, max_num_steps
+    ):
+        if network_container.fingerprint is None:
+            raise ValueError("Can't cache visit counts without an edge fingerprint.")
+        self.cache_dir = os.path.join(
+            network_container.cache_dir,
+            "visits",
+            f"{network_container.version}-delta{network_container.delta_edges}"
+            f"-length{max_walk_length}-steps{max_num_steps}",
+        )
+
+    def path(self, node_id) -> str:
+        return os.path.join(self.cache_dir, f"{node_id}.npz")
+
+    def get(self, node_id) -> Optional[ScoreVector]:
+        """Returns the cached visit counts of a seed, or None."""
+        try:
+            with np.load(self.path(node_id)) as visits:
+                return ScoreVector(visits["node_ids"], visits["counts"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def put(self, node_id, node_ids: np.ndarray, counts: np.ndarray):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.path(node_id)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as visits_file:
+            np.savez(
+                visits_file,
+                node_ids=np.asarray(node_ids, dtype="int64"),
+                counts=np.asarray(counts, dtype="int64"),
+            )
+        os.replace(tmp_path, self.path(node_id))